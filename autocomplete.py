@@ -0,0 +1,58 @@
+from bisect import bisect_left
+from heapq import nlargest
+
+from search import PREFIX_END
+from utils import normalize
+
+COMPLETIONS = 10
+MAX_SCAN = 256
+
+
+def normalize_prefix(text):
+    # A trailing space means the last word is complete, so "хоч " does not complete to "хочеш".
+    prefix = normalize(text)
+    return prefix + ' ' if prefix and text[-1:].isspace() else prefix
+
+
+# Keys in a sorted list, so the keys starting with a prefix are one bisect range. Without weights a prefix
+# completes to the first k keys of its range; with weights to the k heaviest, and every prefix matching
+# more than max_scan keys has them precomputed, so no lookup ranks more than max_scan keys.
+class PrefixIndex:
+    def __init__(self, keys, values, weights=None, k=COMPLETIONS, max_scan=MAX_SCAN):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.values = [values[i] for i in order]
+        self.weights = [weights[i] for i in order] if weights is not None else None
+        self.k = k
+        self.max_scan = max_scan
+        self.top = dict()
+        if self.weights is not None:
+            self.precompute('', 0, len(self.keys))
+
+    def get_range(self, prefix):
+        return bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + PREFIX_END)
+
+    def rank(self, start, end):
+        # Heaviest first, then in key order.
+        return [self.values[i] for i in nlargest(self.k, range(start, end), key=lambda i: (self.weights[i], -i))]
+
+    def precompute(self, prefix, start, end):
+        self.top[prefix] = self.rank(start, end)
+        position = start
+        while position < end:
+            key = self.keys[position]
+            if len(key) == len(prefix):
+                position += 1
+                continue
+            child = key[:len(prefix) + 1]
+            child_end = bisect_left(self.keys, child + PREFIX_END, position, end)
+            if child_end - position > self.max_scan:
+                self.precompute(child, position, child_end)
+            position = child_end
+
+    def complete(self, prefix):
+        start, end = self.get_range(prefix)
+        if self.weights is None:
+            return self.values[start:min(end, start + self.k)]
+        top = self.top.get(prefix)
+        return top if top is not None else self.rank(start, end)
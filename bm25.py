@@ -0,0 +1,53 @@
+from array import array
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {'VALUE': 2.0, 'DESCRIPTION': 1.0}
+RANKED_RESULTS = 100
+
+
+# Okapi BM25 over the lemmas of lemmas_usage. A proverb and its description make one document, in which a
+# lemma counts FIELD_WEIGHTS[usage_type] for every field it occurs in. The score of every posting is
+# computed at load, so a query only adds up the arrays of its lemmas and selects the best proverbs.
+class Bm25Index:
+    def __init__(self):
+        self.scores = dict()
+        self.size = 0
+
+    @classmethod
+    def build(cls, lemma_index, k1=K1, b=B, field_weights=FIELD_WEIGHTS):
+        index = cls()
+        index.size = lemma_index.all_ids[-1] + 1 if lemma_index.all_ids else 0
+        frequencies = dict()
+        lengths = np.zeros(index.size)
+        for lemma in lemma_index.get_lemmas():
+            postings = [(lemma_index.postings[usage_type].get(lemma, ()), weight)
+                        for usage_type, weight in field_weights.items() if usage_type in lemma_index.postings]
+            ids = np.concatenate([np.asarray(ids, dtype=np.int32) for ids, _ in postings])
+            weights = np.concatenate([np.full(len(ids), weight) for ids, weight in postings])
+            ids, positions = np.unique(ids, return_inverse=True)
+            frequencies[lemma] = ids, np.bincount(positions, weights=weights)
+            lengths[ids] += frequencies[lemma][1]
+
+        documents = np.count_nonzero(lengths)
+        average_length = lengths.sum() / documents if documents else 1.0
+        for lemma, (ids, frequency) in frequencies.items():
+            idf = np.log(1 + (documents - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1 - b + b * lengths[ids] / average_length)
+            index.scores[lemma] = ids, (idf * frequency * (k1 + 1) / (frequency + norm)).astype(np.float32)
+        return index
+
+    def search(self, lemmas, k=RANKED_RESULTS):
+        # Ids of the k best scoring proverbs, best first; ties keep ascending id order.
+        totals = np.zeros(self.size, dtype=np.float32)
+        for lemma in dict.fromkeys(lemmas):
+            ids, scores = self.scores.get(lemma, (None, None))
+            if ids is not None:
+                totals[ids] += scores
+        candidates = np.flatnonzero(totals)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-totals[candidates], k - 1)[:k]]
+        ranked = candidates[np.lexsort((candidates, -totals[candidates]))]
+        return array('i', ranked.tolist())
@@ -0,0 +1,243 @@
+import random
+from array import array
+from itertools import islice
+
+from autocomplete import PrefixIndex, normalize_prefix
+from bm25 import Bm25Index
+from distractors import DistractorPool, sample_groups
+from fuzzy_index import FuzzyIndex
+from lemma_index import LemmaIndex
+from result_cache import ResultCache
+from search import ProverbSearchResult
+from substring_index import SubstringIndex
+from utils import parse_spans
+
+LEMMA_COMPLETIONS = 5
+
+
+class Category:
+    __slots__ = ('id', 'name', 'proverb_ids', 'verb_proverb_ids', 'descriptions')
+
+    def __init__(self, id, name, rng=random):
+        self.id = id
+        self.name = name
+        self.proverb_ids = array('i')
+        self.verb_proverb_ids = array('i')
+        self.descriptions = DistractorPool(rng)
+
+
+class Proverb:
+    __slots__ = ('id', 'value', 'description', 'category_id', 'value_norm', 'description_norm', 'description_id',
+                 'spans', 'verb', 'verb_spans', 'verb_ids')
+
+    def __init__(self, id, value, description, category_id, value_norm, description_norm, spans):
+        self.id = id
+        self.value = value
+        self.description = description
+        self.category_id = category_id
+        self.value_norm = value_norm
+        self.description_norm = description_norm
+        self.description_id = None
+        # Start and end offsets of the words of the value, and of the quiz verb wherever it occurs.
+        self.spans = parse_spans(spans)
+        self.verb = None
+        self.verb_spans = None
+        # Positions of all of its verbs among the verbs of the quiz verb's form, so no option repeats one.
+        self.verb_ids = ()
+
+
+# Read-only copy of the corpus loaded once at start-up, so the bot serves categories, quizzes and
+# searches without going back to SQLite. Posting lists are arrays of proverb ids in ascending order.
+# Search results are cached per snapshot, so loading a new one also drops them. Quiz options are drawn with
+# a generator of the given seed, so a seeded snapshot asks the same questions every time.
+class Corpus:
+    def __init__(self, result_cache=None, seed=None):
+        self.random = random.Random(seed)
+        self.categories = ()
+        self.category_by_id = dict()
+        self.proverbs = dict()
+        self.lemma_index = LemmaIndex()
+        self.fuzzy_index = FuzzyIndex()
+        self.bm25 = Bm25Index()
+        self.lemma_completions = PrefixIndex([], [])
+        self.proverb_completions = PrefixIndex([], [])
+        self.substring_index = SubstringIndex(self.proverbs)
+        self.first_letters = dict()
+        self.verbs_by_form = dict()
+        self.neighbours = array('i')
+        self.neighbour_offsets = array('i', [0])
+        self.result_cache = result_cache or ResultCache()
+
+    @classmethod
+    def load(cls, db, result_cache=None, seed=None):
+        corpus = cls(result_cache, seed)
+        corpus.result_cache.clear()
+        categories = [Category(category_id, name, corpus.random) for category_id, name in
+                      db.select_all('SELECT id, name FROM category ORDER BY id')]
+        corpus.categories = tuple(categories)
+        corpus.category_by_id = {category.id: category for category in categories}
+
+        for row in db.select_all(
+                'SELECT id, value, description, category_id, value_norm, description_norm, spans FROM proverb '
+                'ORDER BY id'):
+            proverb = Proverb(*row)
+            proverb_id, category = proverb.id, corpus.category_by_id[proverb.category_id]
+            corpus.proverbs[proverb_id] = proverb
+            category.proverb_ids.append(proverb_id)
+            proverb.description_id = category.descriptions.add(proverb.description)
+            corpus.first_letters.setdefault(proverb.value_norm[:1], array('i')).append(proverb_id)
+        corpus.substring_index = SubstringIndex.build(corpus.proverbs)
+
+        corpus.lemma_index = LemmaIndex.load(db)
+        lemmas = sorted(corpus.lemma_index.get_lemmas())
+        corpus.fuzzy_index = FuzzyIndex.build(lemmas)
+        corpus.bm25 = Bm25Index.build(corpus.lemma_index)
+        corpus.lemma_completions = PrefixIndex(
+            lemmas, lemmas, [len(corpus.lemma_index.get_postings(lemma, ['VALUE', 'DESCRIPTION'])) for lemma in lemmas],
+            k=LEMMA_COMPLETIONS)
+        corpus.proverb_completions = PrefixIndex([proverb.value_norm for proverb in corpus.proverbs.values()],
+                                                 list(corpus.proverbs))
+
+        verbs_by_form = dict()
+        proverb_verbs = dict()
+        for proverb_id, usage_type, value, aspect, number, gender, tense, spans in db.select_all(
+                "SELECT proverb_id, usage_type, value, aspect, number, gender, tense, spans FROM word "
+                "WHERE pos = 'VERB' ORDER BY id"):
+            form = (aspect, number, gender, tense)
+            verbs_by_form.setdefault(form, dict())[value] = None
+            proverb_verbs.setdefault(proverb_id, []).append(value)
+            proverb = corpus.proverbs[proverb_id]
+            if usage_type == 'VALUE' and proverb.verb is None:
+                proverb.verb = (value,) + form
+                proverb.verb_spans = parse_spans(spans)
+                corpus.category_by_id[proverb.category_id].verb_proverb_ids.append(proverb_id)
+        # Distinct verbs of every form, with the position of each, so that a quiz can leave out its own verbs.
+        corpus.verbs_by_form = {form: (tuple(verbs), {verb: verb_id for verb_id, verb in enumerate(verbs)})
+                                for form, verbs in verbs_by_form.items()}
+        for proverb_id, values in proverb_verbs.items():
+            proverb = corpus.proverbs[proverb_id]
+            if proverb.verb is not None:
+                verb_ids = corpus.verbs_by_form[proverb.verb[1:]][1]
+                proverb.verb_ids = tuple({verb_ids[value] for value in values if value in verb_ids})
+
+        # Neighbours of proverb i are neighbours[neighbour_offsets[i]:neighbour_offsets[i + 1]]. A sync without
+        # --neighbours can leave rows that name deleted proverbs, so those are skipped.
+        size = max(corpus.proverbs, default=0) + 1
+        counts = array('i', bytes(4 * size))
+        for proverb_id, neighbour_id in db.select_all(
+                'SELECT proverb_id, neighbour_id FROM proverb_neighbour ORDER BY proverb_id, rank'):
+            if proverb_id not in corpus.proverbs or neighbour_id not in corpus.proverbs:
+                continue
+            corpus.neighbours.append(neighbour_id)
+            counts[proverb_id] += 1
+        for count in counts:
+            corpus.neighbour_offsets.append(corpus.neighbour_offsets[-1] + count)
+        return corpus
+
+    def count_categories(self):
+        return len(self.categories)
+
+    def get_categories(self, limit, offset):
+        return [(category.id, category.name) for category in self.categories[offset:offset + limit]]
+
+    def get_category_name(self, category_id):
+        return self.category_by_id[category_id].name
+
+    def get_proverb_ids(self, category_id):
+        return self.category_by_id[category_id].proverb_ids
+
+    def get_verb_proverb_ids(self, category_id):
+        return self.category_by_id[category_id].verb_proverb_ids
+
+    def get_proverb(self, proverb_id):
+        return self.proverbs[proverb_id]
+
+    def get_wrong_descriptions(self, proverb_id, k=3):
+        # Distinct descriptions of the proverb's topic that differ from its own.
+        proverb = self.proverbs[proverb_id]
+        return self.category_by_id[proverb.category_id].descriptions.sample(proverb.description_id, k)
+
+    def get_verb(self, proverb_id):
+        return self.proverbs[proverb_id].verb
+
+    def get_words(self, proverb_id):
+        # Words of the proverb in text order, without punctuation.
+        proverb = self.proverbs[proverb_id]
+        spans = proverb.spans
+        return [proverb.value[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2)]
+
+    def split_at_verb(self, proverb_id):
+        # Pieces of the proverb around every occurrence of its quiz verb, to be joined by a blank.
+        proverb = self.proverbs[proverb_id]
+        spans = proverb.verb_spans
+        starts = [0] + [spans[i + 1] for i in range(0, len(spans), 2)]
+        ends = [spans[i] for i in range(0, len(spans), 2)] + [len(proverb.value)]
+        return [proverb.value[start:end] for start, end in zip(starts, ends)]
+
+    def get_wrong_verbs(self, proverb_id, k=3, group_size=1):
+        # Groups of verbs in the form of the proverb's verb, other than the verbs of the proverb.
+        proverb = self.proverbs[proverb_id]
+        verbs = self.verbs_by_form[proverb.verb[1:]][0]
+        return sample_groups(verbs, group_size, k, set(proverb.verb_ids), self.random)
+
+    def get_similar(self, proverb_id):
+        # Ids of the proverbs closest in meaning, most similar first.
+        if proverb_id + 1 >= len(self.neighbour_offsets):
+            return array('i')
+        return self.neighbours[self.neighbour_offsets[proverb_id]:self.neighbour_offsets[proverb_id + 1]]
+
+    def find_proverb_ids(self, filter):
+        # Yields matching ids in ascending order, lazily, so a page only costs what precedes it. Free text
+        # searches yield the best matches in relevance order instead.
+        if filter.lemma:
+            yield from self.lemma_index.find(filter.lemma_query, filter.usage_types)
+        elif filter.first_proverb_letter:
+            if not filter.prefix:
+                return
+            for proverb_id in self.first_letters.get(filter.prefix[:1], ()):
+                if self.proverbs[proverb_id].value_norm.startswith(filter.prefix):
+                    yield proverb_id
+        elif filter.substring:
+            yield from self.substring_index.find(filter.substring)
+        elif filter.text:
+            yield from self.bm25.search(filter.terms)
+
+    def suggest_lemmas(self, word, usage_types, k=3):
+        # Lemmas close to a word that occur with the given usage types, nearest and then most used first.
+        suggestions = []
+        for distance, lemma in self.fuzzy_index.find(word):
+            count = len(self.lemma_index.get_postings(lemma, usage_types))
+            if count and lemma != word:
+                suggestions.append((distance, -count, lemma))
+        return [lemma for _, _, lemma in sorted(suggestions)[:k]]
+
+    def complete_lemmas(self, text):
+        # Most used lemmas starting with the text.
+        return self.lemma_completions.complete(normalize_prefix(text))
+
+    def complete_proverbs(self, text):
+        # Ids of proverbs whose normalized text starts with the text, in alphabetical order.
+        return self.proverb_completions.complete(normalize_prefix(text))
+
+    def search_ids(self, filter):
+        # Uncached and free of shared state but the corpus itself, so a search thread can run it.
+        return array('i', self.find_proverb_ids(filter))
+
+    def find_ids(self, filter):
+        key = filter.get_key()
+        proverb_ids = self.result_cache.get(key)
+        if proverb_ids is None:
+            proverb_ids = self.search_ids(filter)
+            self.result_cache.put(key, proverb_ids)
+        return proverb_ids
+
+    def get_results(self, proverb_ids):
+        results = []
+        for proverb_id in proverb_ids:
+            proverb = self.proverbs[proverb_id]
+            results.append(ProverbSearchResult(self.category_by_id[proverb.category_id].name, proverb.value,
+                                               proverb.description, proverb_id))
+        return results
+
+    def search_proverbs(self, filter, offset=0, limit=5):
+        return self.get_results(islice(self.find_proverb_ids(filter), offset, offset + limit))
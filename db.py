@@ -2,35 +2,75 @@ import sqlite3
 
 import utils
 
+DB_FILE = 'proverbs.db'
+SQLITE_MAX_VARIABLES = 999
+
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('proverbs.db')
-        self.c = self.conn.cursor()
+    def __init__(self, file_name=DB_FILE, read_only=False):
+        if read_only:
+            self.conn = sqlite3.connect(f'file:{file_name}?mode=ro', uri=True)
+        else:
+            self.conn = sqlite3.connect(file_name)
+            # WAL lets the bot keep reading while an ingestion run writes; the mode is stored in the file.
+            self.conn.execute('PRAGMA journal_mode = WAL')
 
-    def init(self):
+    def run_script(self, prefixes=('',), skip=()):
+        # Runs the statements of the script that start with one of prefixes and with none of skip.
         script = utils.read("resources/dbscript.sql").replace('\n', ' ').split(';')
         for stmt in script:
             stmt = stmt.strip()
-            if stmt:
+            if stmt and stmt.startswith(prefixes) and not stmt.startswith(skip):
                 self.execute(stmt)
 
-    def execute(self, sql):
-        self.c.execute(sql)
-        self.conn.commit()
+    def init(self):
+        # Indexes are left to create_indexes(), so a rebuild writes its rows before building them.
+        self.run_script(skip=('CREATE INDEX',))
+
+    def create_indexes(self):
+        self.run_script(('CREATE INDEX',))
+
+    def create_tables(self):
+        # Runs only the CREATE TABLE statements of the script, so existing data survives.
+        self.run_script(('CREATE TABLE',))
+
+    def execute(self, sql, *args, commit=True):
+        self.conn.execute(sql, self.update_args(args))
+        if commit:
+            self.conn.commit()
 
     def insert(self, sql, *args):
-        self.c.execute(sql, self.update_args(args))
+        cursor = self.conn.execute(sql, self.update_args(args))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def insert_many(self, table, columns, rows):
+        # Multi-row INSERT without a commit, so a caller can load many batches inside one transaction.
+        if not rows:
+            return
+        row_placeholder = '(' + ', '.join('?' for _ in columns) + ')'
+        chunk_size = max(1, SQLITE_MAX_VARIABLES // len(columns))
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ' + ', '.join(row_placeholder for _ in chunk)
+            args = []
+            for row in chunk:
+                args.extend(self.update_args(row))
+            self.conn.execute(sql, args)
+
+    def delete_in(self, table, column, values):
+        for start in range(0, len(values), SQLITE_MAX_VARIABLES):
+            chunk = values[start:start + SQLITE_MAX_VARIABLES]
+            self.conn.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join("?" for _ in chunk)})', chunk)
+
+    def commit(self):
         self.conn.commit()
-        return self.c.lastrowid
 
     def select_one(self, sql, *args):
-        self.c.execute(sql, args)
-        return self.c.fetchone()
+        return self.conn.execute(sql, args).fetchone()
 
     def select_all(self, sql, *args):
-        self.c.execute(sql, self.update_args(args))
-        return self.c.fetchall()
+        return self.conn.execute(sql, self.update_args(args)).fetchall()
 
     def update_args(self, args):
         new_args = []
@@ -55,3 +95,4 @@ class Database:
         return self.select_all(
             "SELECT description FROM proverb WHERE category_id != ? AND description != ? ORDER BY RANDOM() LIMIT 3",
             (category_id, exclude_description))
+
@@ -0,0 +1,59 @@
+import random
+from itertools import combinations
+from math import comb
+
+from utils import normalize
+
+MAX_DRAWS = 8
+SMALL_POOL = 64
+
+
+# Distinct options of one quiz topic under small integer ids. Options that normalize() to the same text share
+# an id, so two wrong options never read the same and none of them repeats the right answer.
+class DistractorPool:
+    def __init__(self, rng=random):
+        self.rng = rng
+        self.options = []
+        self.ids = dict()
+
+    def add(self, option):
+        key = normalize(option)
+        option_id = self.ids.get(key)
+        if option_id is None:
+            option_id = self.ids[key] = len(self.options)
+            self.options.append(option)
+        return option_id
+
+    def sample(self, exclude_id, k=3):
+        # Up to k options other than exclude_id in random order. Sampling a range touches only the drawn
+        # indexes, so a question costs O(k) however large the topic is.
+        count = len(self.options)
+        k = min(k, count - (0 <= exclude_id < count))
+        option_ids = self.rng.sample(range(count), min(count, k + 1))
+        return [self.options[option_id] for option_id in option_ids if option_id != exclude_id][:k]
+
+
+def sample_groups(options, size, k, excluded, rng=random, max_draws=MAX_DRAWS):
+    # Up to k distinct groups of size options each, joined by ", ", leaving out the options whose index is in
+    # excluded. Groups are drawn at random and rejected on a clash instead of listing every combination, so a
+    # question costs O(k * size) draws however many options there are. In a pool of at most SMALL_POOL options
+    # the excluded ones can be most of it, so draws are taken from the rest, and when that has only a few groups
+    # to give they are listed and sampled, so none is missed.
+    option_ids = range(len(options))
+    if len(options) <= SMALL_POOL:
+        option_ids = [option_id for option_id in option_ids if option_id not in excluded]
+        count = comb(len(option_ids), size)
+        if count <= max_draws * k:
+            return [', '.join(options[option_id] for option_id in rng.sample(group, size))
+                    for group in rng.sample(list(combinations(option_ids, size)), min(k, count))]
+    if len(option_ids) < size:
+        return []
+    groups = dict()
+    for _ in range(max_draws * k):
+        if len(groups) == k:
+            break
+        group = rng.sample(option_ids, size)
+        if not excluded.isdisjoint(group):
+            continue
+        groups.setdefault(frozenset(group), ', '.join(options[option_id] for option_id in group))
+    return list(groups.values())
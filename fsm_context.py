@@ -0,0 +1,64 @@
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+
+
+# FSM context of a single update. Data is read from storage on first use and both state and data are changed in
+# memory, so a handler can call get_data and update_data as often as it likes; flush() writes what changed.
+class BufferedContext(FSMContext):
+    def __init__(self, context, state=None):
+        super().__init__(context.storage, context.key)
+        self.state = self.stored_state = state
+        self.data = None
+        self.data_changed = False
+
+    async def load(self):
+        if self.data is None:
+            self.data = await self.storage.get_data(self.key)
+        return self.data
+
+    async def set_state(self, state=None):
+        self.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self):
+        return self.state
+
+    async def set_data(self, data):
+        self.data = dict(data)
+        self.data_changed = True
+
+    async def get_data(self):
+        return (await self.load()).copy()
+
+    async def get_value(self, key, default=None):
+        return (await self.load()).get(key, default)
+
+    async def update_data(self, data=None, **kwargs):
+        if data:
+            kwargs.update(data)
+        (await self.load()).update(kwargs)
+        self.data_changed = True
+        return self.data.copy()
+
+    async def flush(self):
+        if self.state != self.stored_state:
+            await self.storage.set_state(self.key, self.state)
+            self.stored_state = self.state
+        if self.data_changed:
+            await self.storage.set_data(self.key, self.data)
+            self.data_changed = False
+
+
+# Hands every handler a BufferedContext instead of the plain FSM context and flushes it once the update is
+# handled. It starts from the raw_state FSMContextMiddleware has read, so an update costs at most one read of
+# the data and one write each of state and data. The whole data dict is written back, so the Dispatcher needs an
+# events isolation such as SimpleEventIsolation: that middleware then holds a per-user lock until the flush.
+class FSMUnitOfWork(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        if data.get('state') is None:
+            return await handler(event, data)
+        context = data['state'] = BufferedContext(data['state'], data.get('raw_state'))
+        try:
+            return await handler(event, data)
+        finally:
+            await context.flush()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+FSM_FILE = 'fsm.db'
+FSM_CACHE_SIZE = 10000
+FSM_TTL = 30 * 24 * 60 * 60
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 1000
+EXPIRE_INTERVAL = 60 * 60
+
+
+def get_key(key):
+    return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.business_connection_id}:{key.destiny}'
+
+
+# FSM storage in a local SQLite file, so state survives a restart. Recently used records stay in an LRU cache of
+# cache_size entries; changes are kept as pending and written together, every flush_interval seconds or once
+# max_pending records changed, so a record updated many times in that window is written once. A record not
+# changed for ttl seconds reads as empty and is deleted from the file every expire_interval seconds.
+class SqliteStorage(BaseStorage):
+    def __init__(self, file_name=FSM_FILE, cache_size=FSM_CACHE_SIZE, ttl=FSM_TTL, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING, expire_interval=EXPIRE_INTERVAL):
+        self.conn = sqlite3.connect(file_name)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fsm_record (key varchar(255) primary key, state varchar(255), '
+                          'data text not null, updated_at real not null)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS fsm_record_updated_idx ON fsm_record (updated_at)')
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.expire_interval = expire_interval
+        # Records are [state, data, updated_at]; pending ones are also referenced from pending until written.
+        self.cache = OrderedDict()
+        self.pending = dict()
+        self.flush_handle = None
+        self.expired_at = time.time()
+        self.reads = 0
+        self.writes = 0
+
+    def get_record(self, key):
+        key = get_key(key)
+        record = self.cache.get(key) or self.pending.get(key)
+        if record is None:
+            self.reads += 1
+            row = self.conn.execute('SELECT state, data, updated_at FROM fsm_record WHERE key = ?', (key,)).fetchone()
+            record = [row[0], json.loads(row[1]), row[2]] if row else [None, {}, 0.0]
+        if record[2] and record[2] < time.time() - self.ttl:
+            record = [None, {}, 0.0]
+        self.cache[key] = record
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return key, record
+
+    def change(self, key, record):
+        record[2] = time.time()
+        self.pending[key] = record
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO fsm_record (key, state, data, updated_at) VALUES (?, ?, ?, ?)',
+                                  [(key, state, json.dumps(data, ensure_ascii=False), updated_at)
+                                   for key, (state, data, updated_at) in self.pending.items()])
+            if now - self.expired_at >= self.expire_interval:
+                self.conn.execute('DELETE FROM fsm_record WHERE updated_at < ?', (now - self.ttl,))
+                self.expired_at = now
+        self.writes += len(self.pending)
+        self.pending.clear()
+
+    async def set_state(self, key, state=None):
+        key, record = self.get_record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self.change(key, record)
+
+    async def get_state(self, key):
+        return self.get_record(key)[1][0]
+
+    async def set_data(self, key, data):
+        key, record = self.get_record(key)
+        record[1] = dict(data)
+        self.change(key, record)
+
+    async def get_data(self, key):
+        return self.get_record(key)[1][1].copy()
+
+    async def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,79 @@
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7
+
+
+def get_deletes(word, max_distance):
+    # Strings left after deleting 0, 1, ... max_distance characters, one set per count.
+    levels = [{word}]
+    for _ in range(max_distance):
+        levels.append({variant[:i] + variant[i + 1:] for variant in levels[-1] for i in range(len(variant))})
+    return levels
+
+
+def edit_distance(first, second, max_distance):
+    # Damerau-Levenshtein distance with adjacent transpositions; anything above max_distance is max_distance + 1.
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i] + [0] * len(second)
+        for j, other in enumerate(second, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+# Symmetric delete index: every word is stored under the strings left after deleting up to max_distance
+# characters of its first prefix_length characters, kept apart by the number of deleted characters. Words
+# within distance d of a query share a delete of at most d characters with it, so a lookup checks a handful
+# of candidates instead of every word.
+class FuzzyIndex:
+    def __init__(self, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = []
+        self.deletes = [dict() for _ in range(max_distance + 1)]
+
+    @classmethod
+    def build(cls, words, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        index = cls(max_distance, prefix_length)
+        index.words = list(words)
+        for word_id, word in enumerate(index.words):
+            for deletes, level in zip(index.deletes, get_deletes(word[:prefix_length], max_distance)):
+                for delete in level:
+                    word_ids = deletes.get(delete)
+                    # Most deletes belong to a single word, which is kept as a bare id rather than a list.
+                    if word_ids is None:
+                        deletes[delete] = word_id
+                    elif isinstance(word_ids, int):
+                        deletes[delete] = [word_ids, word_id]
+                    else:
+                        word_ids.append(word_id)
+        return index
+
+    def find(self, word):
+        # Returns (distance, word) pairs of indexed words close to the given one, closest first. Words under
+        # six letters allow a single edit: two deletes from them are shared by too many words to be useful.
+        max_distance = min(self.max_distance, max(1, len(word) // 3))
+        candidates = set()
+        for level in get_deletes(word[:self.prefix_length], max_distance):
+            for delete in level:
+                for deletes in self.deletes[:max_distance + 1]:
+                    word_ids = deletes.get(delete)
+                    if isinstance(word_ids, int):
+                        candidates.add(word_ids)
+                    elif word_ids is not None:
+                        candidates.update(word_ids)
+        matches = []
+        for word_id in candidates:
+            candidate = self.words[word_id]
+            distance = edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        matches.sort()
+        return matches
@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_left
+
+GALLOP_RATIO = 16
+
+
+def union(posting_lists):
+    return array('i', sorted(set().union(*posting_lists)))
+
+
+def intersect(first, second):
+    if len(first) > len(second):
+        first, second = second, first
+    if len(first) * GALLOP_RATIO >= len(second):
+        # Lists of similar length are cheaper to intersect with C-level set operations.
+        return array('i', sorted(set(first).intersection(second)))
+    # A short list walks the long one with binary search, never moving back in it.
+    result = array('i')
+    position = 0
+    for proverb_id in first:
+        position = bisect_left(second, proverb_id, position)
+        if position == len(second):
+            break
+        if second[position] == proverb_id:
+            result.append(proverb_id)
+    return result
+
+
+def difference(first, second):
+    if len(first) * GALLOP_RATIO >= len(second):
+        return array('i', sorted(set(first).difference(second)))
+    result = array('i')
+    position = 0
+    for proverb_id in first:
+        position = bisect_left(second, proverb_id, position)
+        if position == len(second) or second[position] != proverb_id:
+            result.append(proverb_id)
+    return result
+
+
+# Inverted index from normalized lemma to the ascending ids of proverbs using it, kept per usage type.
+class LemmaIndex:
+    def __init__(self):
+        self.postings = dict()
+        self.all_ids = array('i')
+
+    @classmethod
+    def load(cls, db):
+        index = cls()
+        for lemma, usage_type, proverb_id in db.select_all(
+                'SELECT DISTINCT l.value_norm, lu.usage_type, lu.proverb_id FROM lemmas_usage lu '
+                'JOIN lemma l ON l.id = lu.lemma_id ORDER BY lu.usage_type, l.value_norm, lu.proverb_id'):
+            index.postings.setdefault(usage_type, dict()).setdefault(lemma, array('i')).append(proverb_id)
+        # Searches over proverbs and descriptions together are common, so their merged lists are kept too.
+        usage_types = tuple(sorted(index.postings))
+        lemmas = set()
+        for postings in index.postings.values():
+            lemmas.update(postings)
+        index.postings[usage_types] = {lemma: union([index.postings[usage_type].get(lemma, ())
+                                                     for usage_type in usage_types]) for lemma in lemmas}
+        index.all_ids = array('i', (row[0] for row in db.select_all(
+            'SELECT DISTINCT proverb_id FROM lemmas_usage ORDER BY proverb_id')))
+        return index
+
+    def get_lemmas(self):
+        lemmas = set()
+        for usage_type, postings in self.postings.items():
+            if isinstance(usage_type, str):
+                lemmas.update(postings)
+        return lemmas
+
+    def get_postings(self, lemma, usage_types):
+        if len(usage_types) == 1:
+            return self.postings.get(usage_types[0], {}).get(lemma, ())
+        merged = self.postings.get(tuple(sorted(usage_types)))
+        if merged is not None:
+            return merged.get(lemma, ())
+        return union([self.postings.get(usage_type, {}).get(lemma, ()) for usage_type in usage_types])
+
+    def find(self, query, usage_types):
+        groups = [self.get_postings(group[0], usage_types) if len(group) == 1 else
+                  union([self.get_postings(lemma, usage_types) for lemma in group]) for group in query.groups]
+        if not groups and not query.excluded:
+            return array('i')
+        groups.sort(key=len)
+        result = groups[0] if groups else self.all_ids
+        for posting_list in groups[1:]:
+            if not result:
+                break
+            result = intersect(result, posting_list)
+        for lemma in query.excluded:
+            result = difference(result, self.get_postings(lemma, usage_types))
+        return result
@@ -0,0 +1,57 @@
+import os
+
+import utils
+from db import Database
+
+MIGRATIONS_DIR = 'resources/migrations'
+
+
+def get_migrations():
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if file_name.endswith('.sql'):
+            migrations.append((int(file_name.split('_')[0]), os.path.join(MIGRATIONS_DIR, file_name)))
+    return migrations
+
+
+def get_version(db):
+    return db.select_one('PRAGMA user_version')[0]
+
+
+def get_token_spans(text):
+    return utils.format_spans(utils.get_token_spans(text))
+
+
+def get_word_spans(text, word):
+    # Spans of the tokens of a text that are the given word of a word row.
+    return utils.format_spans((start, end) for start, end in utils.get_token_spans(text)
+                              if text[start:end].lower() == word)
+
+
+def migrate(db):
+    # Applies every migration newer than the user_version stored in the file, each in its own transaction.
+    # dbscript.sql creates the schema of the latest migration and sets user_version to its number, so on a
+    # fresh database none of them runs.
+    version = get_version(db)
+    # Lets migrations fill derived columns of existing rows with the same functions ingestion uses.
+    db.conn.create_function('normalize', 1, utils.normalize, deterministic=True)
+    db.conn.create_function('token_spans', 1, get_token_spans, deterministic=True)
+    db.conn.create_function('word_spans', 2, get_word_spans, deterministic=True)
+    for number, file_name in get_migrations():
+        if number <= version:
+            continue
+        db.execute('BEGIN', commit=False)
+        script = utils.read(file_name).replace('\n', ' ').split(';')
+        for stmt in script:
+            stmt = stmt.strip()
+            if stmt:
+                db.execute(stmt, commit=False)
+        db.execute(f'PRAGMA user_version = {number}', commit=False)
+        db.commit()
+        print(f'Applied migration {file_name}')
+
+
+if __name__ == '__main__':
+    db = Database()
+    migrate(db)
+    print(f'Database is at version {get_version(db)}')
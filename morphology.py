@@ -0,0 +1,176 @@
+import asyncio
+import sqlite3
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pymorphy2 as pymorphy2
+
+from utils import get_token_spans, normalize
+
+PARSE_CACHE_SIZE = 50000
+QUERY_WORKERS = 2
+QUERY_CACHE_SIZE = 10000
+
+Parse = namedtuple('Parse', ['lemma', 'pos', 'aspect', 'number', 'person', 'gender', 'tense'])
+Token = namedtuple('Token', ['word', 'lemma', 'pos', 'aspect', 'number', 'person', 'gender', 'tense', 'start', 'end'])
+
+
+class Morphology:
+    def __init__(self, cache_size=PARSE_CACHE_SIZE):
+        self.analyzer = None
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.disk = None
+        self.disk_rows = []
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_analyzer(self):
+        # The dictionary takes a while to load, so a process that only stores parses made elsewhere never loads it.
+        if self.analyzer is None:
+            self.analyzer = pymorphy2.MorphAnalyzer(lang='uk')
+        return self.analyzer
+
+    def open_disk_cache(self, file_name, read_only=False):
+        # Pool workers only read the cache and hand their new parses to the one process that writes it. WAL lets
+        # them read while it commits.
+        if read_only:
+            self.disk = sqlite3.connect(f'file:{file_name}?mode=ro', uri=True)
+            return
+        self.disk = sqlite3.connect(file_name)
+        self.disk.execute('PRAGMA journal_mode = WAL')
+        self.disk.execute('CREATE TABLE IF NOT EXISTS parse (form varchar(100) primary key, lemma varchar(100), '
+                          'pos varchar(25), aspect varchar(25), number varchar(25), person varchar(25), '
+                          'gender varchar(25), tense varchar(25))')
+
+    def parse(self, word):
+        parsed = self.cache.get(word)
+        if parsed is not None:
+            self.cache.move_to_end(word)
+            self.hits += 1
+            return parsed
+        parsed = self.parse_from_disk(word)
+        if parsed is None:
+            self.misses += 1
+            parsed = self.parse_with_analyzer(word)
+            if self.disk is not None:
+                self.disk_rows.append((word,) + parsed)
+        else:
+            self.disk_hits += 1
+        self.cache[word] = parsed
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return parsed
+
+    def parse_from_disk(self, word):
+        if self.disk is None:
+            return None
+        row = self.disk.execute('SELECT lemma, pos, aspect, number, person, gender, tense FROM parse WHERE form = ?',
+                                (word,)).fetchone()
+        return Parse(*row) if row else None
+
+    def parse_with_analyzer(self, word):
+        # Plain strings instead of the analyzer's grammeme objects, which pool processes cannot pickle.
+        parsed = self.get_analyzer().parse(word)[0]
+        tag = parsed.tag
+        if tag.POS == 'VERB':
+            values = (tag.POS, tag.aspect, tag.number, tag.person, tag.gender, tag.tense)
+        else:
+            values = (tag.POS, None, None, None, None, None)
+        return Parse(str(parsed.normal_form), *(None if value is None else str(value) for value in values))
+
+    def analyze(self, text):
+        # Words without a part of speech, such as numbers, are kept too: the spans of a proverb cover all words.
+        tokens = list()
+        for start, end in get_token_spans(text):
+            word = text[start:end]
+            tokens.append(Token(word.lower(), *self.parse(word), start, end))
+        return tokens
+
+    def analyze_entries(self, entries):
+        # Entries start with (proverb, description); anything after that is passed through untouched.
+        return [(entry, self.analyze(entry[0]), self.analyze(entry[1])) for entry in entries]
+
+    def take_new_parses(self):
+        rows = self.disk_rows
+        self.disk_rows = []
+        return rows
+
+    def save(self):
+        if self.disk is None:
+            return
+        self.disk.executemany('INSERT OR IGNORE INTO parse VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.disk_rows)
+        self.disk.commit()
+        self.disk_rows.clear()
+
+    def hit_ratio(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+worker_morphology = None
+
+
+def init_worker(cache_file=None):
+    global worker_morphology
+    worker_morphology = Morphology()
+    worker_morphology.get_analyzer()
+    if cache_file:
+        worker_morphology.open_disk_cache(cache_file, read_only=True)
+
+
+def analyze_chunk(task):
+    # Runs in a pool process; returns plain records, the cache counters gathered for this chunk and the parses
+    # the analyzer made for it, which the caller stores in the parse cache.
+    category, entries = task
+    hits, disk_hits, misses = worker_morphology.hits, worker_morphology.disk_hits, worker_morphology.misses
+    records = worker_morphology.analyze_entries(entries)
+    counters = (worker_morphology.hits - hits, worker_morphology.disk_hits - disk_hits,
+                worker_morphology.misses - misses)
+    return category, records, counters, worker_morphology.take_new_parses()
+
+
+def lemmatize_words(words):
+    # Runs in a QueryLemmatizer process.
+    return [normalize(worker_morphology.parse(word).lemma) for word in words]
+
+
+# Lemmatizes search terms in processes that load the analyzer when the bot starts, so neither the
+# dictionary load nor the parsing runs on the event loop. Recent terms are answered from an LRU cache.
+class QueryLemmatizer:
+    def __init__(self, workers=QUERY_WORKERS, cache_size=QUERY_CACHE_SIZE):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def warm_up(self):
+        # One task per worker starts every process, and each loads its analyzer before taking a task.
+        for future in [self.executor.submit(lemmatize_words, []) for _ in range(self.workers)]:
+            future.result()
+
+    async def lemmatize(self, words):
+        lemmas = dict()
+        missing = []
+        for word in dict.fromkeys(words):
+            lemma = self.cache.get(word)
+            if lemma is None:
+                missing.append(word)
+            else:
+                self.cache.move_to_end(word)
+                lemmas[word] = lemma
+        self.hits += len(lemmas)
+        self.misses += len(missing)
+        if missing:
+            loop = asyncio.get_running_loop()
+            for word, lemma in zip(missing, await loop.run_in_executor(self.executor, lemmatize_words, missing)):
+                lemmas[word] = self.cache[word] = lemma
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return lemmas
+
+    def close(self):
+        self.executor.shutdown()
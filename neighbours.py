@@ -0,0 +1,81 @@
+from itertools import islice
+
+import numpy as np
+from scipy import sparse
+
+from bm25 import FIELD_WEIGHTS
+
+NEIGHBOURS = 10
+MAX_DOCUMENT_FREQUENCY = 0.1
+MAX_POSTINGS = 100
+CHUNK_SIZE = 2000
+BATCH_SIZE = 50000
+
+
+def get_matrix(db, field_weights=FIELD_WEIGHTS, max_document_frequency=MAX_DOCUMENT_FREQUENCY):
+    # L2-normalized TF-IDF rows of every proverb over the lemmas of lemmas_usage, indexed by proverb id. A lemma
+    # counts field_weights[usage_type] for every field it occurs in. Lemmas of a single proverb cannot make two
+    # proverbs similar, and lemmas of more than max_document_frequency of them are too common to, so both are
+    # left out.
+    rows = db.select_all('SELECT proverb_id, lemma_id, usage_type FROM lemmas_usage')
+    size = db.select_one('SELECT COALESCE(MAX(id), 0) + 1 FROM proverb')[0]
+    lemmas = db.select_one('SELECT COALESCE(MAX(id), 0) + 1 FROM lemma')[0]
+    proverb_ids = np.fromiter((row[0] for row in rows), dtype=np.int32, count=len(rows))
+    lemma_ids = np.fromiter((row[1] for row in rows), dtype=np.int32, count=len(rows))
+    weights = np.fromiter((field_weights.get(row[2], 0.0) for row in rows), dtype=np.float32, count=len(rows))
+    matrix = sparse.csr_matrix((weights, (proverb_ids, lemma_ids)), shape=(size, lemmas), dtype=np.float32)
+    matrix.sum_duplicates()
+
+    documents = np.count_nonzero(np.diff(matrix.indptr))
+    frequency = np.bincount(matrix.indices, minlength=lemmas)
+    useful = (frequency > 1) & (frequency <= max(2, max_document_frequency * documents))
+    idf = np.zeros(lemmas, dtype=np.float32)
+    idf[useful] = np.log(documents / frequency[useful])
+    matrix = (matrix @ sparse.diags(idf)).tocsr()
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ matrix).tocsr().astype(np.float32)
+
+
+def get_candidates(matrix, max_postings=MAX_POSTINGS):
+    # The transposed matrix with only the max_postings heaviest proverbs of every lemma. The pairs left out
+    # have the smallest products, and without them the work is bounded by max_postings per lemma of a proverb
+    # rather than by the square of the document frequency.
+    entries = matrix.tocoo()
+    order = np.lexsort((-entries.data, entries.col))
+    lemma_ids = entries.col[order]
+    kept = order[np.arange(len(order)) - np.searchsorted(lemma_ids, lemma_ids) < max_postings]
+    return sparse.csr_matrix((entries.data[kept], (entries.col[kept], entries.row[kept])),
+                             shape=matrix.shape[::-1])
+
+
+def get_neighbours(matrix, n=NEIGHBOURS, chunk_size=CHUNK_SIZE):
+    # Yields (proverb_id, rank, neighbour_id) for the n proverbs of highest cosine similarity to every proverb,
+    # most similar first and ties in id order. The similarities are computed chunk_size rows at a time, so only
+    # one slice of the similarity matrix is held in memory.
+    candidates = get_candidates(matrix)
+    for start in range(0, matrix.shape[0], chunk_size):
+        similarities = (matrix[start:start + chunk_size] @ candidates).tocsr()
+        for row in range(similarities.shape[0]):
+            begin, end = similarities.indptr[row], similarities.indptr[row + 1]
+            neighbour_ids = similarities.indices[begin:end]
+            scores = similarities.data[begin:end]
+            other = neighbour_ids != start + row
+            neighbour_ids, scores = neighbour_ids[other], scores[other]
+            if len(neighbour_ids) > n:
+                best = np.argpartition(-scores, n - 1)[:n]
+                neighbour_ids, scores = neighbour_ids[best], scores[best]
+            order = np.lexsort((neighbour_ids, -scores))
+            for rank, neighbour_id in enumerate(neighbour_ids[order].tolist()):
+                yield start + row, rank, neighbour_id
+
+
+def rebuild(db, n=NEIGHBOURS):
+    # Replaces the proverb_neighbour table; every change of the corpus shifts the weights of all proverbs.
+    neighbours = get_neighbours(get_matrix(db), n)
+    db.execute('BEGIN', commit=False)
+    db.execute('DELETE FROM proverb_neighbour', commit=False)
+    while batch := list(islice(neighbours, BATCH_SIZE)):
+        db.insert_many('proverb_neighbour', ('proverb_id', 'rank', 'neighbour_id'), batch)
+    db.commit()
@@ -1,110 +1,310 @@
-import json
-import pymorphy2 as pymorphy2
-import tokenize_uk as tokenize_uk
+import argparse
+import hashlib
+import multiprocessing
+import time
+from collections import deque
 
+import neighbours
 import utils
 from db import Database
+from migrations import migrate
+from morphology import Morphology, analyze_chunk, init_worker
 
 db = Database()
-db.init()
-
-analyzer = pymorphy2.MorphAnalyzer(lang='uk')
-
-json_data = utils.read('resources/proverbs-with-description-edited.json')
-data = dict(json.loads(json_data))
-
-
-def get_lemmas(text):
-    lemmas = list()
-    for word in tokenize_uk.tokenize_words(text):
-        parsed = analyzer.parse(word)[0]
-        pos = parsed.tag.POS
-        if pos:
-            lemma = parsed.normal_form
-            lemmas.append((lemma, pos))
-    return lemmas
-
-
-def get_words(text):
-    words = list()
-    for word in tokenize_uk.tokenize_words(text):
-        parsed = analyzer.parse(word)[0]
-        pos = parsed.tag.POS
-        word = word.lower()
-        if pos:
-            if pos == "VERB":
-                aspect = parsed.tag.aspect
-                number = parsed.tag.number
-                person = parsed.tag.person
-                gender = parsed.tag.gender
-                tense = parsed.tag.tense
-                words.append((word, pos, aspect, number, person, gender, tense))
-                continue
-            words.append((word, pos))
-    return words
-
-
-def process_lemmas(text, type, proverb_id):
-    all_lemmas = get_lemmas(text)
-    unique_lemmas = set(all_lemmas)
-    for lemma_info in unique_lemmas:
-        lemma = lemma_info[0]
-        pos = lemma_info[1]
-
-        lemma_id_row = db.select_one(f'SELECT id FROM lemma WHERE value = ?', lemma)
-        if lemma_id_row:
-            lemma_id = lemma_id_row[0]
-        else:
-            lemma_id = db.insert(f'INSERT INTO lemma (value, pos) VALUES (?, ?)', lemma, pos)
-
-        db.insert(f'INSERT INTO lemmas_usage VALUES (?, ?, ?)', lemma_id, proverb_id, type)
-
-
-def process_words(text, type, proverb_id):
-    all_words = get_words(text)
-    unique_words = set(all_words)
-    for word_info in unique_words:
-        word = word_info[0]
-        pos = word_info[1]
-        if pos == "VERB":
-            aspect = word_info[2]
-            number = word_info[3]
-            person = word_info[4]
-            gender = word_info[5]
-            tense = word_info[6]
-            db.insert(
-                f'INSERT INTO word (proverb_id, usage_type, value, pos, aspect, number, person, gender, tense) VALUES '
-                f'(?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                proverb_id, type, word, pos, aspect, number, person, gender, tense)
-        else:
-            db.insert(
-                f'INSERT INTO word (proverb_id, usage_type, value, pos) VALUES (?, ?, ?, ?)', proverb_id, type, word,
-                pos)
+
+morphology = Morphology()
+
+CORPUS_FILE = 'resources/proverbs-with-description-edited.json'
+BATCH_SIZE = 5000
+CHUNK_SIZE = 200
+
+TABLE_COLUMNS = {
+    'category': ('id', 'name'),
+    'proverb': ('id', 'value', 'description', 'category_id', 'value_norm', 'description_norm', 'spans'),
+    'lemma': ('id', 'value', 'pos', 'value_norm'),
+    'lemmas_usage': ('lemma_id', 'proverb_id', 'usage_type'),
+    'word': ('proverb_id', 'usage_type', 'value', 'pos', 'aspect', 'number', 'person', 'gender', 'tense', 'spans'),
+    'proverb_source': ('proverb_id', 'category', 'source', 'fingerprint'),
+}
+
+
+# Buffers rows per table and writes them with multi-row inserts inside one transaction. Category, proverb
+# and lemma ids are assigned here rather than by SQLite, so they continue from load_state() or start at 1.
+# Like AUTOINCREMENT, load_state() continues after the largest id ever used, so a deleted id is not reused.
+class BulkWriter:
+    def __init__(self, db, batch_size=BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.rows = {table: [] for table in TABLE_COLUMNS}
+        self.last_ids = {'category': 0, 'proverb': 0, 'lemma': 0}
+        self.lemma_ids = dict()
+        self.buffered = 0
+        self.written = 0
+
+    def load_state(self):
+        for table in self.last_ids:
+            self.last_ids[table] = self.db.select_one(
+                f'SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM {table}), '
+                f'(SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = ?))', table)[0]
+        self.lemma_ids = dict(self.db.select_all('SELECT value, id FROM lemma'))
+
+    def next_id(self, table):
+        self.last_ids[table] += 1
+        return self.last_ids[table]
+
+    def add(self, table, row):
+        self.rows[table].append(row)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def add_category(self, name):
+        category_id = self.next_id('category')
+        self.add('category', (category_id, name))
+        return category_id
+
+    def add_proverb(self, value, description, category_id, spans):
+        proverb_id = self.next_id('proverb')
+        self.add('proverb', (proverb_id, value, description, category_id, utils.normalize(value),
+                             utils.normalize(description), spans))
+        return proverb_id
+
+    def get_lemma_id(self, lemma, pos):
+        lemma_id = self.lemma_ids.get(lemma)
+        if lemma_id is None:
+            lemma_id = self.next_id('lemma')
+            self.lemma_ids[lemma] = lemma_id
+            self.add('lemma', (lemma_id, lemma, pos, utils.normalize(lemma)))
+        return lemma_id
+
+    def add_lemma_usage(self, lemma_id, proverb_id, type):
+        self.add('lemmas_usage', (lemma_id, proverb_id, type))
+
+    def add_word(self, proverb_id, type, word, pos, aspect=None, number=None, person=None, gender=None, tense=None,
+                 spans=None):
+        self.add('word', (proverb_id, type, word, pos, aspect, number, person, gender, tense, spans))
+
+    def add_source(self, proverb_id, category, source, fingerprint):
+        self.add('proverb_source', (proverb_id, category, source, fingerprint))
+
+    def flush(self):
+        for table, columns in TABLE_COLUMNS.items():
+            rows = self.rows[table]
+            self.db.insert_many(table, columns, rows)
+            self.written += len(rows)
+            rows.clear()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.db.commit()
+
+
+writer = BulkWriter(db)
+
+
+def process_lemmas(tokens, type, proverb_id):
+    unique_lemmas = dict.fromkeys((token.lemma, token.pos) for token in tokens if token.pos)
+    for lemma, pos in unique_lemmas:
+        lemma_id = writer.get_lemma_id(lemma, pos)
+        writer.add_lemma_usage(lemma_id, proverb_id, type)
+
+
+def process_words(tokens, type, proverb_id):
+    # One row per distinct word, holding the spans of all its occurrences in the text.
+    unique_words = dict()
+    for token in tokens:
+        if token.pos:
+            word_info = (token.word, token.pos) + token[3:8]
+            span = f'{token.start}:{token.end}'
+            spans = unique_words.get(word_info)
+            unique_words[word_info] = span if spans is None else spans + ' ' + span
+    for word_info, spans in unique_words.items():
+        writer.add_word(proverb_id, type, *word_info, spans=spans)
+
+
+def fingerprint(category, proverb, description):
+    return hashlib.sha1(f'{category}\n{proverb}\n{description}'.encode('utf8')).hexdigest()
 
 
-def process_proverb(proverb, description):
+def expand_proverb(proverb, description):
     substring_description = " Синонім. "
     substring_synonyms = "; "
+    entries = list()
     if substring_description in description:
         parts = description.split(substring_description)
         synonyms = parts[1].split(substring_synonyms)
         description = parts[0]
         synonyms = list(synonyms)
         for synonym in synonyms:
-            process_proverb(synonym, description)
+            entries.extend(expand_proverb(synonym, description))
+    entries.append((proverb, description))
+    return entries
 
-    proverb_id = db.insert(f'INSERT INTO proverb (value, description, category_id) VALUES (?, ?, ?)',
-                           proverb, description, category_id)
 
-    process_lemmas(proverb, 'VALUE', proverb_id)
-    process_lemmas(description, 'DESCRIPTION', proverb_id)
-    process_words(proverb, 'VALUE', proverb_id)
-    process_words(description, 'DESCRIPTION', proverb_id)
+def get_entries(category, proverb, description):
+    # Every proverb row remembers the JSON entry it came from, so a later sync can find what changed.
+    source_fingerprint = fingerprint(category, proverb, description)
+    return [(value, value_description, proverb, source_fingerprint)
+            for value, value_description in expand_proverb(proverb, description)]
 
 
-if __name__ == '__main__':
-    for category, proverbs in data.items():
-        category_id = db.insert(f'INSERT INTO category (name) VALUES (?)', category)
+def write_record(record, category, category_id, proverb_id=None):
+    (proverb, description, source, source_fingerprint), proverb_tokens, description_tokens = record
+    if proverb_id is None:
+        proverb_id = writer.add_proverb(proverb, description, category_id,
+                                        utils.format_spans((token.start, token.end) for token in proverb_tokens))
+    else:
+        db.execute('UPDATE proverb SET description = ?, description_norm = ?, category_id = ? WHERE id = ?',
+                   description, utils.normalize(description), category_id, proverb_id, commit=False)
+    writer.add_source(proverb_id, category, source, source_fingerprint)
+
+    process_lemmas(proverb_tokens, 'VALUE', proverb_id)
+    process_lemmas(description_tokens, 'DESCRIPTION', proverb_id)
+    process_words(proverb_tokens, 'VALUE', proverb_id)
+    process_words(description_tokens, 'DESCRIPTION', proverb_id)
+
+
+def process_proverb(proverb, description, category, category_id):
+    for record in morphology.analyze_entries(get_entries(category, proverb, description)):
+        write_record(record, category, category_id)
+
+
+def get_category_id(category, category_ids):
+    category_id = category_ids.get(category)
+    if category_id is None:
+        category_id = category_ids[category] = writer.add_category(category)
         print(f'Processing category: {category}')
-        for proverb, description in proverbs.items():
-            process_proverb(proverb, description)
+    return category_id
+
+
+def process_serial(records):
+    category_ids = dict()
+    for category, proverb, description in records:
+        process_proverb(proverb, description, category, get_category_id(category, category_ids))
+
+
+def get_tasks(records, chunk_size=CHUNK_SIZE):
+    current_category = None
+    entries = list()
+    for category, proverb, description in records:
+        if entries and (category != current_category or len(entries) >= chunk_size):
+            yield current_category, entries
+            entries = list()
+        current_category = category
+        entries.extend(get_entries(category, proverb, description))
+    if entries:
+        yield current_category, entries
+
+
+def write_chunk(category, records, counters, parses, category_ids):
+    category_id = get_category_id(category, category_ids)
+    for record in records:
+        write_record(record, category, category_id)
+    morphology.hits += counters[0]
+    morphology.disk_hits += counters[1]
+    morphology.misses += counters[2]
+    morphology.disk_rows.extend(parses)
+    if len(morphology.disk_rows) >= BATCH_SIZE:
+        morphology.save()
+
+
+def process_parallel(records, workers, cache_file=None):
+    # Workers only analyse; this process writes chunks in submission order, so ids match the serial run, and is
+    # the only writer of the parse cache. At most two chunks per worker are in flight, so a large corpus is never
+    # read ahead into memory.
+    category_ids = dict()
+    pending = deque()
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(cache_file,)) as pool:
+        for task in get_tasks(records):
+            pending.append(pool.apply_async(analyze_chunk, (task,)))
+            if len(pending) >= workers * 2:
+                write_chunk(*pending.popleft().get(), category_ids)
+        while pending:
+            write_chunk(*pending.popleft().get(), category_ids)
+
+
+def sync(records):
+    # Re-analyses only added or changed JSON entries and removes rows of entries that are gone.
+    writer.load_state()
+    stored = dict()
+    for proverb_id, category, source, source_fingerprint in db.select_all(
+            'SELECT proverb_id, category, source, fingerprint FROM proverb_source'):
+        stored.setdefault((category, source), [source_fingerprint, []])[1].append(proverb_id)
+    category_ids = dict(db.select_all('SELECT name, id FROM category'))
+    proverb_ids = dict(db.select_all('SELECT value, id FROM proverb'))
+
+    changed = list()
+    outdated_ids = list()
+    for category, proverb, description in records:
+        stored_entry = stored.pop((category, proverb), None)
+        if stored_entry and stored_entry[0] == fingerprint(category, proverb, description):
+            continue
+        changed.append((category, proverb, description))
+        if stored_entry:
+            outdated_ids.extend(stored_entry[1])
+
+    removed_ids = [proverb_id for stored_entry in stored.values() for proverb_id in stored_entry[1]]
+    # Proverbs of a database built before proverb_source have no entry to compare with, so they are rewritten
+    # like outdated ones: every entry of the corpus is changed then and reuses the id of its value.
+    outdated_ids.extend(row[0] for row in db.select_all(
+        'SELECT id FROM proverb WHERE id NOT IN (SELECT proverb_id FROM proverb_source)'))
+    for table, column in (('lemmas_usage', 'proverb_id'), ('word', 'proverb_id'), ('proverb_source', 'proverb_id')):
+        db.delete_in(table, column, outdated_ids + removed_ids)
+
+    reused_ids = set()
+    for category, proverb, description in changed:
+        category_id = get_category_id(category, category_ids)
+        for record in morphology.analyze_entries(get_entries(category, proverb, description)):
+            proverb_id = proverb_ids.pop(record[0][0], None)
+            if proverb_id is not None:
+                reused_ids.add(proverb_id)
+            write_record(record, category, category_id, proverb_id)
+    writer.flush()
+
+    deleted_ids = [proverb_id for proverb_id in outdated_ids + removed_ids if proverb_id not in reused_ids]
+    db.delete_in('proverb', 'id', deleted_ids)
+    # Other proverbs may still list a deleted one as a neighbour until --neighbours; Corpus.load skips those.
+    db.delete_in('proverb_neighbour', 'proverb_id', deleted_ids)
+    db.execute('DELETE FROM category WHERE id NOT IN (SELECT category_id FROM proverb)', commit=False)
+    db.execute('DELETE FROM lemma WHERE id NOT IN (SELECT lemma_id FROM lemmas_usage)', commit=False)
+    print(f'Synced {len(changed)} changed entries, removed {len(removed_ids)} proverbs')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=CORPUS_FILE, help='proverbs JSON or JSONL file to load')
+    parser.add_argument('--parse-cache', help='sqlite file that keeps analyzer results between runs')
+    parser.add_argument('--workers', type=int, default=1, help='number of analyzer processes')
+    parser.add_argument('--sync', action='store_true',
+                        help='update the existing database with changed entries instead of rebuilding it')
+    parser.add_argument('--neighbours', action='store_true',
+                        help='recompute similar proverbs after --sync, which takes seconds on a large corpus; '
+                             'a rebuild always does')
+    args = parser.parse_args()
+    if args.parse_cache:
+        morphology.open_disk_cache(args.parse_cache)
+    records = utils.iter_corpus(args.corpus)
+
+    start = time.perf_counter()
+    if args.sync:
+        db.create_tables()
+        migrate(db)
+        sync(records)
+        writer.close()
+        if args.neighbours:
+            neighbours.rebuild(db)
+    else:
+        db.init()
+        if args.workers > 1:
+            process_parallel(records, args.workers, args.parse_cache)
+        else:
+            process_serial(records)
+        writer.close()
+        db.create_indexes()
+        neighbours.rebuild(db)
+    morphology.save()
+    elapsed = time.perf_counter() - start
+    print(f'Written {writer.written} rows in {elapsed:.2f} s ({writer.written / elapsed:.0f} rows/s)')
+    print(f'Parse cache hit ratio: {morphology.hit_ratio():.1%} '
+          f'({morphology.hits} memory, {morphology.disk_hits} disk, {morphology.misses} analyzed)')
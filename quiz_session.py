@@ -0,0 +1,44 @@
+import random
+
+SEED_BITS = 32
+
+
+def get_order(seed, count):
+    # Positions 0..count-1 shuffled by a generator of the seed. A topic holds a few dozen proverbs at most, so
+    # shuffling again for every question costs less than keeping the order in FSM state.
+    return random.Random(seed).sample(range(count), count)
+
+
+# Progress of one learner through the proverbs of a topic, in an order fixed by a random seed. The order is
+# computed rather than stored, so a session is five small integers in FSM state whatever the size of the topic.
+# answer is whatever the current question needs to check a reply.
+class QuizSession:
+    __slots__ = ('category_id', 'seed', 'cursor', 'score', 'answer')
+
+    def __init__(self, category_id, seed, cursor=0, score=0, answer=None):
+        self.category_id = category_id
+        self.seed = seed
+        self.cursor = cursor
+        self.score = score
+        self.answer = answer
+
+    @classmethod
+    def start(cls, category_id, rng=random):
+        return cls(category_id, rng.getrandbits(SEED_BITS))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(*state)
+
+    def to_state(self):
+        return [self.category_id, self.seed, self.cursor, self.score, self.answer]
+
+    def is_finished(self, proverb_ids):
+        return self.cursor >= len(proverb_ids)
+
+    def get_proverb_id(self, proverb_ids):
+        return proverb_ids[get_order(self.seed, len(proverb_ids))[self.cursor]]
+
+    def record(self, correct):
+        self.score += correct
+        self.cursor += 1
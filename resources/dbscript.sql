@@ -1,8 +1,11 @@
+PRAGMA user_version = 5;
+DROP TABLE IF EXISTS proverb_neighbour;
 DROP TABLE IF EXISTS lemmas_usage;
 DROP TABLE IF EXISTS proverb;
 DROP TABLE IF EXISTS lemma;
 DROP TABLE IF EXISTS category;
 DROP TABLE IF EXISTS word;
+DROP TABLE IF EXISTS proverb_source;
 
 CREATE TABLE IF NOT EXISTS category (
     id integer primary key autoincrement,
@@ -14,13 +17,17 @@ CREATE TABLE IF NOT EXISTS proverb (
     value varchar(255) unique not null,
     description varchar(500) not null,
     category_id integer not null,
+    value_norm varchar(255),
+    description_norm varchar(500),
+    spans varchar(1000),
     foreign key (category_id) references category(id)
 );
 
 CREATE TABLE IF NOT EXISTS lemma (
     id integer primary key autoincrement,
     value varchar(100) unique not null,
-    pos varchar(25) not null
+    pos varchar(25) not null,
+    value_norm varchar(100)
 );
 
 CREATE TABLE IF NOT EXISTS lemmas_usage (
@@ -42,5 +49,27 @@ CREATE TABLE IF NOT EXISTS word (
     person varchar(25) DEFAULT 'None',
     gender varchar(25) DEFAULT 'None',
     tense varchar(25) DEFAULT 'None',
+    spans varchar(255),
+    foreign key (proverb_id) references proverb(id)
+);
+
+CREATE TABLE IF NOT EXISTS proverb_source (
+    proverb_id integer primary key,
+    category varchar(100) not null,
+    source varchar(255) not null,
+    fingerprint varchar(40) not null,
     foreign key (proverb_id) references proverb(id)
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS proverb_neighbour (
+    proverb_id integer not null,
+    rank integer not null,
+    neighbour_id integer not null,
+    primary key (proverb_id, rank)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS lemmas_usage_lemma_idx ON lemmas_usage (lemma_id, usage_type, proverb_id);
+CREATE INDEX IF NOT EXISTS lemmas_usage_proverb_idx ON lemmas_usage (proverb_id);
+CREATE INDEX IF NOT EXISTS proverb_category_value_idx ON proverb (category_id, value);
+CREATE INDEX IF NOT EXISTS word_proverb_idx ON word (proverb_id, usage_type, pos, value, aspect, number, gender, tense);
+CREATE INDEX IF NOT EXISTS word_verb_form_idx ON word (pos, aspect, number, gender, tense, value, proverb_id);
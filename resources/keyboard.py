@@ -9,7 +9,8 @@ search = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='За лемою у паремії', callback_data='by_lemma_in_proverb'),
      InlineKeyboardButton(text='За лемою у паремії і тлумаченні', callback_data='by_lemma_in_proverb_and_meaning')],
     [InlineKeyboardButton(text='За першою літерою паремії', callback_data='by_first_letter_in_proverb'),
-     InlineKeyboardButton(text='За частинкою у паремії і тлумаченні', callback_data='by_substring_in_proverb')]])
+     InlineKeyboardButton(text='За частинкою у паремії і тлумаченні', callback_data='by_substring_in_proverb')],
+    [InlineKeyboardButton(text='За змістом: найкращі збіги', callback_data='by_relevance')]])
 
 study = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='Вправа: скласти прислів\'я/приказку')],
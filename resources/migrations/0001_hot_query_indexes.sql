@@ -0,0 +1,7 @@
+CREATE INDEX IF NOT EXISTS lemmas_usage_lemma_idx ON lemmas_usage (lemma_id, usage_type, proverb_id);
+CREATE INDEX IF NOT EXISTS lemma_first_letter_idx ON lemma (substr(value, 1, 1), value);
+CREATE INDEX IF NOT EXISTS proverb_category_value_idx ON proverb (category_id, value);
+CREATE INDEX IF NOT EXISTS proverb_category_description_idx ON proverb (category_id, description);
+CREATE INDEX IF NOT EXISTS proverb_first_letter_idx ON proverb (substr(value, 1, 1));
+CREATE INDEX IF NOT EXISTS word_proverb_idx ON word (proverb_id, usage_type, pos, value, aspect, number, gender, tense);
+CREATE INDEX IF NOT EXISTS word_verb_form_idx ON word (pos, aspect, number, gender, tense, value, proverb_id);
\ No newline at end of file
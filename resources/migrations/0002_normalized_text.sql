@@ -0,0 +1,9 @@
+ALTER TABLE proverb ADD COLUMN value_norm varchar(255);
+ALTER TABLE proverb ADD COLUMN description_norm varchar(500);
+ALTER TABLE lemma ADD COLUMN value_norm varchar(100);
+UPDATE proverb SET value_norm = normalize(value), description_norm = normalize(description) WHERE value_norm IS NULL;
+UPDATE lemma SET value_norm = normalize(value) WHERE value_norm IS NULL;
+DROP INDEX IF EXISTS proverb_first_letter_idx;
+DROP INDEX IF EXISTS lemma_first_letter_idx;
+CREATE INDEX IF NOT EXISTS proverb_value_norm_idx ON proverb (value_norm);
+CREATE INDEX IF NOT EXISTS lemma_value_norm_idx ON lemma (value_norm);
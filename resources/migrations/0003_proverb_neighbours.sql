@@ -0,0 +1 @@
+CREATE TABLE IF NOT EXISTS proverb_neighbour (proverb_id integer not null, rank integer not null, neighbour_id integer not null, primary key (proverb_id, rank)) WITHOUT ROWID;
@@ -0,0 +1,4 @@
+ALTER TABLE proverb ADD COLUMN spans varchar(1000);
+ALTER TABLE word ADD COLUMN spans varchar(255);
+UPDATE proverb SET spans = token_spans(value) WHERE spans IS NULL;
+UPDATE word SET spans = word_spans((SELECT CASE word.usage_type WHEN 'VALUE' THEN p.value ELSE p.description END FROM proverb p WHERE p.id = word.proverb_id), word.value) WHERE spans IS NULL;
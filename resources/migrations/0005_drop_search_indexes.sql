@@ -0,0 +1,4 @@
+DROP INDEX IF EXISTS proverb_value_norm_idx;
+DROP INDEX IF EXISTS lemma_value_norm_idx;
+DROP INDEX IF EXISTS proverb_category_description_idx;
+CREATE INDEX IF NOT EXISTS lemmas_usage_proverb_idx ON lemmas_usage (proverb_id);
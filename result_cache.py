@@ -0,0 +1,43 @@
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = 1000
+RESULT_CACHE_TTL = 60 * 60
+
+
+# LRU cache of search results keyed by ProverbsFilter.get_key(). An entry is dropped ttl seconds after
+# it was stored, and the least recently used entry once more than size entries are kept.
+class ResultCache:
+    def __init__(self, size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,8 +1,54 @@
+from utils import normalize
+
+# Sorts after every other character, so [prefix, prefix + PREFIX_END) is the range of strings with that prefix.
+PREFIX_END = '\U0010ffff'
+
+
 class ProverbSearchResult:
-    def __init__(self, category, proverb, description):
+    def __init__(self, category, proverb, description, id=None):
         self.category = category
         self.proverb = proverb
         self.description = description
+        self.id = id
+
+
+class LemmaQuery:
+    # "праця хліб" needs both lemmas, "праця|робота" either of them and "-лінь" excludes a lemma.
+    def __init__(self, groups, excluded):
+        self.groups = groups
+        self.excluded = excluded
+
+    @classmethod
+    def parse(cls, text):
+        groups = []
+        excluded = []
+        for token in text.split():
+            if token.startswith('-') and len(token) > 1:
+                lemma = normalize(token[1:])
+                if lemma:
+                    excluded.append(lemma)
+            else:
+                group = [lemma for lemma in map(normalize, token.split('|')) if lemma]
+                if group:
+                    groups.append(group)
+        return cls(groups, excluded)
+
+    def __str__(self):
+        return ' '.join(['|'.join(group) for group in self.groups] + ['-' + lemma for lemma in self.excluded])
+
+    def replace(self, term, lemma):
+        return LemmaQuery([[lemma if other == term else other for other in group] for group in self.groups],
+                          self.excluded)
+
+    def get_terms(self):
+        return [term for group in self.groups for term in group] + self.excluded
+
+    def with_lemmas(self, lemmas):
+        # Every term also stands for its lemma, so "хочу" finds proverbs that use "хотіти".
+        def expand(terms):
+            return list(dict.fromkeys(lemma for term in terms for lemma in (term, lemmas.get(term, term))))
+
+        return LemmaQuery([expand(group) for group in self.groups], expand(self.excluded))
 
 
 class ProverbsFilter:
@@ -10,51 +56,31 @@ class ProverbsFilter:
     def __init__(self,
                  lemma=None, usage_types=None,
                  first_proverb_letter=None,
-                 substring=None):
+                 substring=None, text=None, lemmas=None):
         self.lemma = lemma
+        self.lemma_query = LemmaQuery.parse(lemma) if lemma else None
+        if self.lemma_query and lemmas:
+            self.lemma_query = self.lemma_query.with_lemmas(lemmas)
         self.usage_types = usage_types
         self.first_proverb_letter = first_proverb_letter
         self.substring = substring
+        # Matched against the normalized text, so case, apostrophe and dash variants do not matter.
+        self.prefix = normalize(first_proverb_letter) if first_proverb_letter else None
+        self.needle = normalize(substring) if substring else None
+        # Free text ranked by relevance: its words, each replaced by its lemma when one is known.
+        self.text = text
+        self.terms = list(dict.fromkeys((lemmas or {}).get(word, word) for word in normalize(text).split())) \
+            if text else None
 
-    def get_query(self, offset: int = 0):
+    def get_key(self):
+        # Filters that differ only in case, apostrophes, punctuation or term order share a key.
         if self.lemma:
-            usage_types_query_part = ''
-            for usage_type in self.usage_types:
-                usage_types_query_part += f" lu.usage_type = '{usage_type}' OR"
-            usage_types_query_part = usage_types_query_part[:-2]
-            query = 'SELECT DISTINCT c.name, p.value, p.description FROM lemma l ' \
-                    'JOIN lemmas_usage lu ON l.id = lu.lemma_id ' \
-                    'JOIN proverb p on lu.proverb_id = p.id ' \
-                    f'JOIN category c on p.category_id = c.id WHERE ({usage_types_query_part}) AND l.value = ? LIMIT ' \
-                    f'5 OFFSET ?'
-            return query, [self.lemma, offset]
+            return ('lemma', tuple(sorted(self.usage_types)),
+                    tuple(sorted(tuple(sorted(group)) for group in self.lemma_query.groups)),
+                    tuple(sorted(self.lemma_query.excluded)))
         elif self.first_proverb_letter:
-            query = f' SELECT DISTINCT c.name, p.value, p.description FROM proverb p ' \
-                    f'JOIN category c ON p.category_id = c.id ' \
-                    f'WHERE substr(p.value,1,1) IN(?, ?) LIMIT 5 OFFSET ?'
-            return query, [self.first_proverb_letter.lower(), self.first_proverb_letter.upper(), offset]
+            return 'prefix', self.prefix
         elif self.substring:
-            query = f'SELECT DISTINCT c.name, p.value, p.description FROM proverb p ' \
-                    f'JOIN category c ON p.category_id = c.id ' \
-                    f'WHERE p.value LIKE (\'%\' || ? || \'%\') OR ' \
-                    f'p.description LIKE (\'%\' || ? || \'%\') LIMIT 5 OFFSET ?'
-            return query, [self.substring, self.substring, offset]
-
-
-def search_proverbs(filter, db, offset: int = 0):
-    query, params = filter.get_query(offset=offset)
-    rows = db.select_all(query, *params)
-
-    results = []
-    for row in rows:
-        result = ProverbSearchResult(row[0], row[1], row[2])
-        results.append(result)
-
-    return results
-
-
-def search_lemmas_by_first_letter(letter, usage_type, db):
-    rows = db.select_all('SELECT DISTINCT (l.value) FROM lemmas_usage u JOIN lemma l ON u.lemma_id = l.id '
-                         'WHERE u.usage_type = ? AND substr(l.value,1,1) = ? ORDER BY l.value', usage_type,
-                         letter.lower())
-    return [row[0] for row in rows]
+            return 'substring', self.needle
+        elif self.text:
+            return 'text', tuple(sorted(self.terms))
@@ -0,0 +1,49 @@
+import secrets
+import time
+from collections import OrderedDict
+
+SESSION_TTL = 30 * 60
+MAX_SESSION_IDS = 2_000_000
+
+
+# Ids of every match of a search, kept under a random key so that later pages are slices of the same
+# array rather than new queries. A session expires ttl seconds after its last use, and the least recently
+# used sessions are dropped while all of them together hold more than max_ids ids.
+class SearchSessions:
+    def __init__(self, ttl=SESSION_TTL, max_ids=MAX_SESSION_IDS):
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self.sessions = OrderedDict()
+        self.size = 0
+
+    def add(self, proverb_ids):
+        self.expire()
+        key = secrets.token_urlsafe(8)
+        self.sessions[key] = (time.monotonic() + self.ttl, proverb_ids)
+        self.size += len(proverb_ids)
+        while self.size > self.max_ids and len(self.sessions) > 1:
+            self.pop(next(iter(self.sessions)))
+        return key
+
+    def get(self, key):
+        session = self.sessions.get(key)
+        if session is None or session[0] < time.monotonic():
+            self.pop(key)
+            return None
+        self.sessions[key] = (time.monotonic() + self.ttl, session[1])
+        self.sessions.move_to_end(key)
+        return session[1]
+
+    def pop(self, key):
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            self.size -= len(session[1])
+
+    def expire(self):
+        # Sessions are ordered by last use, so the expired ones are all at the front.
+        now = time.monotonic()
+        while self.sessions:
+            key, (expires_at, _) = next(iter(self.sessions.items()))
+            if expires_at >= now:
+                break
+            self.pop(key)
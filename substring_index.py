@@ -0,0 +1,53 @@
+from array import array
+
+from lemma_index import intersect
+from utils import normalize
+
+NGRAM_SIZE = 3
+
+
+def get_ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+# Trigram index over the normalized value and description of every proverb. A query intersects the posting
+# lists of its trigrams and checks the few remaining candidates, so it does not touch every proverb.
+class SubstringIndex:
+    def __init__(self, proverbs):
+        self.proverbs = proverbs
+        self.postings = dict()
+
+    @classmethod
+    def build(cls, proverbs):
+        index = cls(proverbs)
+        for proverb in proverbs.values():
+            for ngram in get_ngrams(proverb.value_norm) | get_ngrams(proverb.description_norm):
+                posting_list = index.postings.get(ngram)
+                if posting_list is None:
+                    posting_list = index.postings[ngram] = array('i')
+                posting_list.append(proverb.id)
+        return index
+
+    def matches(self, proverb, needle):
+        return needle in proverb.value_norm or needle in proverb.description_norm
+
+    def find(self, substring):
+        # Yields ids in ascending order; proverbs are expected to be keyed in ascending id order. Punctuation
+        # alone normalizes to an empty needle, which is in every text, so it matches nothing instead.
+        needle = normalize(substring)
+        if not needle:
+            return
+        if len(needle) < NGRAM_SIZE:
+            for proverb in self.proverbs.values():
+                if self.matches(proverb, needle):
+                    yield proverb.id
+            return
+        posting_lists = sorted((self.postings.get(ngram, ()) for ngram in get_ngrams(needle)), key=len)
+        candidates = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            if not candidates:
+                return
+            candidates = intersect(candidates, posting_list)
+        for proverb_id in candidates:
+            if self.matches(self.proverbs[proverb_id], needle):
+                yield proverb_id
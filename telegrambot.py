@@ -1,21 +1,30 @@
 import asyncio
+import gc
 import logging
 import random
-import re
-from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineQuery, InlineQueryResultArticle, \
+    InputTextMessageContent
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, KeyboardButton, \
     InlineKeyboardBuilder
 
 import resources.keyboard as kb
+from corpus import Corpus
 from db import Database
+from fsm_context import FSMUnitOfWork
+from fsm_storage import SqliteStorage
+from morphology import QueryLemmatizer
+from quiz_session import QuizSession
 from resources.config import TOKEN
-from search import ProverbsFilter, search_proverbs
+from search import LemmaQuery, ProverbsFilter
+from search_sessions import SearchSessions
+from utils import escape_markdown, normalize
 
 
 class Test(StatesGroup):
@@ -29,15 +38,14 @@ class Test(StatesGroup):
 
 
 class Search(StatesGroup):
-    search_type = State()
     lemma = State()
-    offset = State()
     lemma_meaning = State()
     letter = State()
     substring = State()
+    text = State()
     send_results = State()
-    results = State()
-    next_search = State()
+    search_session = State()
+    cursor = State()
 
 
 class Quiz(StatesGroup):
@@ -60,23 +68,29 @@ class QuizVerb(StatesGroup):
     correct_answers = State()
 
 
-db = Database()
+corpus = Corpus.load(Database(read_only=True))
+lemmatizer = QueryLemmatizer()
+search_executor = ThreadPoolExecutor(1, thread_name_prefix='search')
+search_sessions = SearchSessions()
 router = Router()
 bot = Bot(token=TOKEN)
-dp = Dispatcher()
+fsm_storage = SqliteStorage()
+# Updates of one user are handled one at a time, so a buffered context never writes back data another changed.
+dp = Dispatcher(storage=fsm_storage, events_isolation=SimpleEventIsolation())
+dp.update.outer_middleware(FSMUnitOfWork())
 PAGE_SIZE = 7
+MESSAGE_LENGTH = 4096
 
 
 async def choose_category(message: Message, page: int = 1,
                           call: CallbackQuery = None):
     offset = (page - 1) * PAGE_SIZE
-    categories = db.select_all('SELECT id, name FROM category LIMIT ? OFFSET ?',
-                               PAGE_SIZE, offset)
+    categories = corpus.get_categories(PAGE_SIZE, offset)
     builder = InlineKeyboardBuilder()
     for category_id, category_name in categories:
         builder.add(InlineKeyboardButton(text=category_name,
                                          callback_data=f'category:{category_id}'))
-    if db.select_one('SELECT COUNT(*) FROM category')[0] > page * PAGE_SIZE:
+    if corpus.count_categories() > page * PAGE_SIZE:
         builder.add(InlineKeyboardButton(text='Далі...',
                                          callback_data=f'page:{page + 1}'))
     if page > 1:
@@ -92,15 +106,6 @@ async def choose_category(message: Message, page: int = 1,
                              reply_markup=builder.as_markup())
 
 
-def generate_groups(verbs, group_size):
-    if group_size < 1:
-        raise ValueError("Group size must be at least 1")
-    all_combinations = list(combinations(verbs, group_size))
-    random.shuffle(all_combinations)
-    groups = [", ".join(comb) for comb in all_combinations]
-    return groups
-
-
 @router.callback_query(F.data.startswith('page:'))
 async def handle_page_switch(callback: CallbackQuery):
     page = int(callback.data.split(':')[1])
@@ -108,6 +113,29 @@ async def handle_page_switch(callback: CallbackQuery):
     await callback.answer()
 
 
+def generate_similar_markup(proverb_id, builder=None):
+    # None if there is neither a neighbour of the proverb nor another button to show.
+    if builder is None:
+        builder = InlineKeyboardBuilder()
+    if proverb_id is not None and corpus.get_similar(proverb_id):
+        builder.row(InlineKeyboardButton(text='Схожі прислів\'я', callback_data=f'similar:{proverb_id}'))
+    return builder.as_markup() if list(builder.buttons) else None
+
+
+# Registered ahead of the quiz handlers, which take every callback in their states.
+@router.callback_query(F.data.startswith('similar:'))
+async def show_similar(callback: CallbackQuery):
+    proverb_id = int(callback.data.removeprefix('similar:'))
+    text = 'Схожі за змістом прислів\'я/приказки:'
+    for result in corpus.get_results(corpus.get_similar(proverb_id)):
+        entry = f'\n\n{result.proverb}\nЗначення: {result.description}'
+        if len(text) + len(entry) > MESSAGE_LENGTH:
+            break
+        text += entry
+    await callback.message.answer(text, disable_notification=True)
+    await callback.answer()
+
+
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     await message.answer('Оберіть опцію на своїй клавіатурі.',
@@ -138,13 +166,17 @@ async def get_help(message: Message):
         '*Вправа: доповнити прислів\'я/приказку дієсловом* \\- обрати на клавіатурі дієслово, якого не вистачає\n\n'
         '`Пошук 🔎`\\- кнопка для пошуку\n'
         '*за лемою у паремії* \\- пошук за лемою, яка є частиною прислів\'я/приказки\n'
-        '_лема це канонічна форма лексеми\\. Наприклад: "хотіти" лема слів "хочу", "хотіла" і т\\.д\\._\n'
+        '_лема це канонічна форма лексеми\\. Наприклад: "хотіти" лема слів "хочу", "хотіла" і т\\.д\\. '
+        'Слово можна вводити у будь\\-якій формі, бот сам знайде його лему\\._\n'
         '*за лемою у паремії і тлумаченні* \\- пошук за лемою, яка є частиною самого прислів\'я/приказки або тлумачення\n'
+        '_можна поєднати кілька лем: "праця хліб" \\- обидві, "праця\\|робота" \\- будь\\-яка з них, '
+        '"\\-лінь" \\- без цієї леми_\n'
         '*за першою літерою паремії* \\- пошук за літерою, на яку починається прислів\'я/приказка\n'
         '*за частинкою у паремії і тлумаченні* \\- пошук за будь\\-яким набором слів, букв у прислів\'ї/приказці або '
         'тлумаченні\n'
         '_наприклад: за пошуком "берись дру", "сутуж" або "не буде" бот знайде таку паремію "Берись дружно — не буде '
-        'сутужно\\."_')
+        'сутужно\\."_\n'
+        '*за змістом* \\- пошук за кількома словами у паремії і тлумаченні, найвідповідніші паремії показуються першими')
     await message.answer(text, reply_markup=kb.main, parse_mode='MarkdownV2')
 
 
@@ -154,85 +186,64 @@ async def construct_proverb(message: Message, state: FSMContext):
     await state.set_state(Test.test1)
 
 
+async def get_quiz_session(state: FSMContext):
+    return QuizSession.from_state((await state.get_data())['quiz'])
+
+
+async def send_quiz_result(chat_id, session, text):
+    category_name = corpus.get_category_name(session.category_id)
+    await bot.send_message(chat_id,
+                           text=f'{text}{category_name}'
+                                f'\nВаш результат: {session.score} правильних із {session.cursor}.'
+                                f'\nОберіть іншу тему або завершіть навчання.',
+                           reply_markup=kb.end_test)
+
+
+async def ask_words(chat_id, session, reply_markup=None):
+    words = corpus.get_words(session.get_proverb_id(corpus.get_proverb_ids(session.category_id)))
+    random.shuffle(words)
+    await bot.send_message(chat_id,
+                           text='Складіть прислів\'я/приказку зі слів: \n' + '\n'.join(
+                               words),
+                           reply_markup=reply_markup)
+
+
 @router.callback_query(Test.test1)
 async def for_category(callback: CallbackQuery, state: FSMContext):
     category_id = int(callback.data.removeprefix('category:'))
-    category_name = \
-        db.select_one('SELECT name FROM category WHERE id = ?', category_id)[0]
+    category_name = corpus.get_category_name(category_id)
     await callback.message.edit_text('Обрано тему: ' + category_name)
-    await state.update_data(correct_answers=0)
-    proverbs = db.select_all('SELECT value FROM proverb WHERE category_id = ?',
-                             category_id)
-    proverbs = [proverb[0] for proverb in proverbs]
-    await state.update_data(category_proverbs=proverbs)
-    proverb = random.choice(proverbs)
-    words = proverb.split()
-    random.shuffle(words)
-    await bot.send_message(callback.message.chat.id,
-                           text='Складіть прислів\'я/приказку зі слів: \n' + '\n'.join(
-                               words),
-                           reply_markup=kb.ongoing_test)
+    session = QuizSession.start(category_id)
+    await ask_words(callback.message.chat.id, session, kb.ongoing_test)
     await state.set_state(Test.correct_proverb)
-    await state.update_data(category_id=category_id)
-    await state.update_data(correct_proverb=proverb)
+    await state.update_data(quiz=session.to_state())
 
 
 def compare_strings(str1, str2):
-    def clean_string(s):
-        return re.sub(r'[\W_]', '', s).lower()
-
-    cleaned_str1 = clean_string(str1)
-    cleaned_str2 = clean_string(str2)
-    return cleaned_str1 == cleaned_str2
+    return normalize(str1) == normalize(str2)
 
 
 @router.message(Test.correct_proverb)
 async def check_proverb(message: Message, state: FSMContext):
-    data = await state.get_data()
-    correct_proverb = data['correct_proverb']
+    session = await get_quiz_session(state)
+    proverb_ids = corpus.get_proverb_ids(session.category_id)
     if message.text not in ["Завершити", "Обрати іншу тему"]:
-        if compare_strings(message.text, correct_proverb):
-            await message.answer("Правильно! 🎉")
-            correct_answers = (await state.get_data())['correct_answers']
-            correct_answers += 1
-            await state.update_data(correct_answers=correct_answers)
-        else:
-            await message.answer(
-                "Неправильно :(\nПравильний порядок: " + correct_proverb)
-
-        if 'used_proverbs' not in data:
-            used_proverbs = []
-        else:
-            used_proverbs = data['used_proverbs']
-        used_proverbs.append(correct_proverb)
-        await state.update_data(used_proverbs=used_proverbs)
-        category_proverbs = data['category_proverbs']
-        category_id = data['category_id']
-        chat_id = message.chat.id
-        proverbs = []
-        for proverb in category_proverbs:
-            if proverb not in used_proverbs:
-                proverbs.append(proverb)
-        if not proverbs:
-            correct_answers = (await state.get_data())['correct_answers']
-            category_name = (
-                db.select_one('SELECT name FROM category WHERE id = ?',
-                              category_id))[0]
-            await bot.send_message(chat_id,
-                                   text=f'Вітаю! Ви зібрали усі прислів\'я/приказки з теми: '
-                                        f'{category_name}'
-                                        f'\nВаш результат: {correct_answers} правильних із {len(used_proverbs)}.'
-                                        f'\nОберіть іншу тему або завершіть навчання.',
-                                   reply_markup=kb.end_test)
+        if not session.is_finished(proverb_ids):
+            proverb_id = session.get_proverb_id(proverb_ids)
+            correct_proverb = corpus.get_proverb(proverb_id).value
+            similar_markup = generate_similar_markup(proverb_id)
+            correct = compare_strings(message.text, correct_proverb)
+            if correct:
+                await message.answer("Правильно! 🎉", reply_markup=similar_markup)
+            else:
+                await message.answer(
+                    "Неправильно :(\nПравильний порядок: " + correct_proverb, reply_markup=similar_markup)
+            session.record(correct)
+            await state.update_data(quiz=session.to_state())
+        if session.is_finished(proverb_ids):
+            await send_quiz_result(message.chat.id, session, 'Вітаю! Ви зібрали усі прислів\'я/приказки з теми: ')
             return
-        proverb = random.choice(proverbs)
-        words = proverb.split()
-        random.shuffle(words)
-        await bot.send_message(message.chat.id,
-                               text='Складіть прислів\'я/приказку зі слів: \n' + '\n'.join(
-                                   words))
-        await state.update_data(correct_proverb=proverb)
-        await state.set_state(Test.correct_proverb)
+        await ask_words(message.chat.id, session)
     elif message.text == 'Завершити':
         await state.clear()
         await message.answer('Вправу завершено.', reply_markup=kb.main)
@@ -250,132 +261,58 @@ async def start_quiz(message: Message, state: FSMContext):
     await state.set_state(Quiz.choosing_category)
 
 
+async def ask_meaning(chat_id, session):
+    # Remembers the position of the right option in session.answer.
+    quiz_proverb = corpus.get_proverb(session.get_proverb_id(corpus.get_proverb_ids(session.category_id)))
+    options = [quiz_proverb.description] + corpus.get_wrong_descriptions(quiz_proverb.id)
+    random.shuffle(options)
+    session.answer = options.index(quiz_proverb.description)
+    reply_markup = generate_quiz_markup(len(options))
+    await bot.send_message(chat_id,
+                           text=f"Прислів'я/Приказка:\n *{escape_markdown(quiz_proverb.value)}*",
+                           parse_mode='MarkdownV2')
+    letters = ['А', 'Б', 'В', 'Г']
+    new_options = escape_markdown('\n'.join(letters[number] + ': ' + option for number, option in enumerate(options)))
+    await bot.send_message(chat_id,
+                           text=f"Варіанти відповідей:\n _{new_options}_",
+                           reply_markup=reply_markup,
+                           parse_mode='MarkdownV2')
+
+
 @router.callback_query(Quiz.choosing_category)
 async def process_category(callback: CallbackQuery, state: FSMContext):
     category_id = int(callback.data.removeprefix('category:'))
-    category_name = \
-        db.select_one('SELECT name FROM category WHERE id = ?', category_id)[0]
-    await callback.message.edit_text(f'Обрано тему: *{category_name}*',
+    category_name = corpus.get_category_name(category_id)
+    await callback.message.edit_text(f'Обрано тему: *{escape_markdown(category_name)}*',
                                      parse_mode='MarkdownV2')
-    await state.update_data(correct_answers=0)
-    proverbs = db.select_all(
-        'SELECT id, value, description FROM proverb WHERE category_id = ?',
-        category_id)
-    await state.update_data(category_proverbs=proverbs)
-    quiz_proverb = random.choice(proverbs)
-    correct_description = quiz_proverb[2]
-    random_descriptions = db.select_all(
-        "SELECT DISTINCT description FROM proverb WHERE category_id = ? AND description != ? ORDER BY RANDOM() LIMIT 3",
-        category_id, correct_description)
-    wrong_descriptions = [desc[0] for desc in random_descriptions]
-    options = [correct_description] + wrong_descriptions
-    random.shuffle(options)
-    reply_markup = generate_quiz_markup(len(options))
-    replace_dict = {".": "\\.", "(": "\\(", ")": "\\)", "!": "\\!", "?": "\\?",
-                    "-": "\\-"}
-    proverb = quiz_proverb[1]
-    for old, new in replace_dict.items():
-        proverb = proverb.replace(old, new)
-    await callback.message.answer(f"Прислів'я/Приказка:\n *{proverb}*",
-                                  parse_mode='MarkdownV2')
-    letters = ['А', 'Б', 'В', 'Г']
-    number = 0
-    for option in options:
-        if option == correct_description:
-            correct_description = letters[number]
-        option = letters[number] + ': ' + option
-        options[number] = option
-        number += 1
-    new_options = '\n'.join(options)
-    for old, new in replace_dict.items():
-        new_options = new_options.replace(old, new)
-    await callback.message.answer(f"Варіанти відповідей:\n _{new_options}_",
-                                  reply_markup=reply_markup,
-                                  parse_mode='MarkdownV2')
-    await state.update_data(correct_description=correct_description,
-                            category_id=category_id,
-                            used_proverb_name=quiz_proverb[1])
+    session = QuizSession.start(category_id)
+    await ask_meaning(callback.message.chat.id, session)
+    await state.update_data(quiz=session.to_state())
     await state.set_state(Quiz.answering_question)
 
 
 @router.message(Quiz.answering_question)
 async def check_answer(message: Message, state: FSMContext):
-    user_data = await state.get_data()
-    correct_description = user_data['correct_description']
+    session = await get_quiz_session(state)
+    proverb_ids = corpus.get_proverb_ids(session.category_id)
     if message.text not in ["Завершити", "Обрати іншу тему"]:
-        if message.text == correct_description:
-            await message.answer("Правильно! 🎉")
-            correct_answers = (await state.get_data())['correct_answers']
-            correct_answers += 1
-            await state.update_data(correct_answers=correct_answers)
-        else:
-            await message.answer(
-                "Неправильно :( Правильне значення: " + correct_description)
-
-        correct_proverb = user_data['used_proverb_name']
-        if 'used_proverbs' not in user_data:
-            used_proverbs = []
-        else:
-            used_proverbs = user_data['used_proverbs']
-        used_proverbs.append(correct_proverb)
-        await state.update_data(used_proverbs=used_proverbs)
-        category_proverbs = (await state.get_data())['category_proverbs']
-        proverbs_number = len(category_proverbs)
-        category_id = (await state.get_data())['category_id']
-        chat_id = message.chat.id
-        proverbs = []
-        for proverb in category_proverbs:
-            if not proverb[1] in used_proverbs:
-                proverbs.append(proverb)
-        if not proverbs:
-            correct_answers = (await state.get_data())['correct_answers']
-            category_name = (
-                db.select_one('SELECT name FROM category WHERE id = ?',
-                              category_id))[0]
-            await bot.send_message(chat_id,
-                                   text=f'Вітаю! Ви співставили усі прислів\'я/приказки з їх тлумаченнями з теми: '
-                                        f'{category_name}'
-                                        f'\nВаш результат: {correct_answers} правильних із {proverbs_number}.'
-                                        f'\nОберіть іншу тему або завершіть навчання.',
-                                   reply_markup=kb.end_test)
+        if not session.is_finished(proverb_ids):
+            correct_description = ['А', 'Б', 'В', 'Г'][session.answer]
+            similar_markup = generate_similar_markup(session.get_proverb_id(proverb_ids))
+            correct = message.text == correct_description
+            if correct:
+                await message.answer("Правильно! 🎉", reply_markup=similar_markup)
+            else:
+                await message.answer(
+                    "Неправильно :( Правильне значення: " + correct_description, reply_markup=similar_markup)
+            session.record(correct)
+        if session.is_finished(proverb_ids):
+            await state.update_data(quiz=session.to_state())
+            await send_quiz_result(message.chat.id, session,
+                                   'Вітаю! Ви співставили усі прислів\'я/приказки з їх тлумаченнями з теми: ')
             return
-        quiz_proverb = random.choice(proverbs)
-        correct_description = quiz_proverb[2]
-        random_descriptions = db.select_all(
-            "SELECT DISTINCT description FROM proverb WHERE category_id = ? AND description != ? ORDER BY RANDOM() "
-            "LIMIT 3",
-            category_id, correct_description)
-        wrong_descriptions = [desc[0] for desc in random_descriptions]
-        options = [correct_description] + wrong_descriptions
-        random.shuffle(options)
-        reply_markup = generate_quiz_markup(len(options))
-        proverb_name = quiz_proverb[1]
-        replace_dict = {".": "\\.", "(": "\\(", ")": "\\)", "!": "\\!",
-                        "?": "\\?", "-": "\\-"}
-        for old, new in replace_dict.items():
-            proverb_name = proverb_name.replace(old, new)
-        await bot.send_message(message.chat.id,
-                               text=f"Прислів'я/Приказка:\n *{proverb_name}*",
-                               parse_mode='MarkdownV2')
-        letters = ['А', 'Б', 'В', 'Г']
-        number = 0
-        for option in options:
-            if option == correct_description:
-                correct_description = letters[number]
-            option = letters[number] + ': ' + option
-            options[number] = option
-            number += 1
-        new_options = '\n'.join(options)
-        for old, new in replace_dict.items():
-            new_options = new_options.replace(old, new)
-        await bot.send_message(message.chat.id,
-                               text=f"Варіанти відповідей:\n _{new_options}_",
-                               reply_markup=reply_markup,
-                               parse_mode='MarkdownV2')
-        await state.update_data(correct_description=correct_description,
-                                category_id=category_id,
-                                used_proverb_name=quiz_proverb[1])
-        await state.set_state(Quiz.answering_question)
+        await ask_meaning(message.chat.id, session)
+        await state.update_data(quiz=session.to_state())
     elif message.text == 'Завершити':
         await state.clear()
         await message.answer('Вправу завершено.', reply_markup=kb.main)
@@ -406,136 +343,57 @@ async def start_quiz(message: Message, state: FSMContext):
     await state.set_state(QuizVerb.choosing_category)
 
 
+async def ask_verb(chat_id, session):
+    quiz_proverb_id = session.get_proverb_id(corpus.get_verb_proverb_ids(session.category_id))
+    correct_verb = corpus.get_verb(quiz_proverb_id)[0]
+    number_of_correct_verbs = 1
+    options = [correct_verb] + corpus.get_wrong_verbs(quiz_proverb_id, 3, number_of_correct_verbs)
+    random.shuffle(options)
+    reply_markup = generate_quiz_verb_markup(options)
+    proverb = '──────'.join(escape_markdown(piece) for piece in corpus.split_at_verb(quiz_proverb_id))
+    await bot.send_message(chat_id,
+                           text=f"Прислів'я/Приказка:\n *{proverb}*",
+                           reply_markup=reply_markup,
+                           parse_mode='MarkdownV2')
+
+
 @router.callback_query(QuizVerb.choosing_category)
 async def process_category(callback: CallbackQuery, state: FSMContext):
     category_id = int(callback.data.removeprefix('category:'))
-    category_name = db.select_one('SELECT name FROM category WHERE id = ?', category_id)[0]
+    category_name = corpus.get_category_name(category_id)
     await callback.message.edit_text('Обрано тему: ' + category_name)
-    await state.update_data(correct_answers=0)
-    proverbs = db.select_all(
-        "SELECT DISTINCT proverb.id, proverb.value FROM proverb JOIN word ON proverb.id = proverb_id WHERE "
-        "proverb.category_id = ? AND word.pos = 'VERB' AND word.usage_type = 'VALUE'",
-        category_id)
-    await state.update_data(category_proverbs=proverbs)
-    quiz_proverb = random.choice(proverbs)
-    quiz_proverb_id = quiz_proverb[0]
-    quiz_proverb_value = quiz_proverb[1]
-    correct_verb_list = db.select_one(
-        "SELECT value, aspect, number, gender, tense FROM word WHERE word.pos = 'VERB' AND word.proverb_id = ? AND "
-        "word.usage_type = 'VALUE'",
-        quiz_proverb_id)
-    correct_verb = correct_verb_list[0]
-    aspect = correct_verb_list[1]
-    number = correct_verb_list[2]
-    gender = correct_verb_list[3]
-    tense = correct_verb_list[4]
-    number_of_correct_verbs = 1
-    random_verbs = db.select_all(
-        'SELECT DISTINCT word.value FROM word JOIN proverb ON proverb_id = proverb.id '
-        "WHERE word.pos = 'VERB' AND word.proverb_id != ? AND word.aspect = ? AND word.number = ? AND word.gender = ? "
-        "AND word.tense = ?",
-        quiz_proverb_id, aspect, number, gender, tense)
-    wrong_verbs = [verb[0] for verb in random_verbs]
-    wrong_verbs = generate_groups(wrong_verbs, number_of_correct_verbs)
-    options = [correct_verb] + random.sample(wrong_verbs, 3)
-    random.shuffle(options)
-    reply_markup = generate_quiz_verb_markup(options)
-    replace_dict = {".": "\\.", "(": "\\(", ")": "\\)", "!": "\\!", "?": "\\?",
-                    "—": "\\—", "-": "\\-"}
-    proverb = quiz_proverb[1]
-    for old, new in replace_dict.items():
-        proverb = proverb.replace(old, new)
-    for verb in correct_verb_list:
-        proverb = re.sub(r'\b' + re.escape(verb) + r'\b', '──────', proverb,
-                         flags=re.IGNORECASE)
-    await callback.message.answer(f"Прислів'я/Приказка:\n *{proverb}*",
-                                  reply_markup=reply_markup,
-                                  parse_mode='MarkdownV2')
-    await state.update_data(correct_verbs=correct_verb, category_id=category_id,
-                            used_proverb_value=quiz_proverb_value)
+    if not corpus.get_verb_proverb_ids(category_id):
+        await callback.message.answer('У цій темі немає прислів\'їв/приказок з дієсловами для вправи.')
+        await choose_category(callback.message)
+        return
+    session = QuizSession.start(category_id)
+    await ask_verb(callback.message.chat.id, session)
+    await state.update_data(quiz=session.to_state())
     await state.set_state(QuizVerb.answering_question)
 
 
 @router.message(QuizVerb.answering_question)
 async def check_answer(message: Message, state: FSMContext):
-    user_data = await state.get_data()
-    correct_verbs = user_data['correct_verbs']
+    session = await get_quiz_session(state)
+    proverb_ids = corpus.get_verb_proverb_ids(session.category_id)
     if message.text not in ["Завершити", "Обрати іншу тему"]:
-        if message.text == correct_verbs:
-            await message.answer("Правильно! 🎉")
-            correct_answers = (await state.get_data())['correct_answers']
-            correct_answers += 1
-            await state.update_data(correct_answers=correct_answers)
-        else:
-            await message.answer(
-                "Неправильно :( Правильне дієслово: " + correct_verbs)
-
-        correct_proverb = user_data['used_proverb_value']
-        if not 'used_proverbs' in user_data:
-            used_proverbs = []
-        else:
-            used_proverbs = user_data['used_proverbs']
-        used_proverbs.append(correct_proverb)
-        await state.update_data(used_proverbs=used_proverbs)
-        category_proverbs = (await state.get_data())['category_proverbs']
-        proverbs_number = len(category_proverbs)
-        category_id = (await state.get_data())['category_id']
-        chat_id = message.chat.id
-        proverbs = []
-        for proverb in category_proverbs:
-            if not proverb[1] in used_proverbs:
-                proverbs.append(proverb)
-        if not proverbs:
-            correct_answers = (await state.get_data())['correct_answers']
-            category_name = (
-                db.select_one('SELECT name FROM category WHERE id = ?',
-                              category_id))[0]
-            await bot.send_message(chat_id,
-                                   text=f'Вітаю! Ви дібрали до усіх прислів\'їв/приказок дієслова з теми: '
-                                        f'{category_name}'
-                                        f'\nВаш результат: {correct_answers} правильних із {proverbs_number}.'
-                                        f'\nОберіть іншу тему або завершіть навчання.',
-                                   reply_markup=kb.end_test)
+        if not session.is_finished(proverb_ids):
+            proverb_id = session.get_proverb_id(proverb_ids)
+            correct_verbs = corpus.get_verb(proverb_id)[0]
+            similar_markup = generate_similar_markup(proverb_id)
+            correct = normalize(message.text) == normalize(correct_verbs)
+            if correct:
+                await message.answer("Правильно! 🎉", reply_markup=similar_markup)
+            else:
+                await message.answer(
+                    "Неправильно :( Правильне дієслово: " + correct_verbs, reply_markup=similar_markup)
+            session.record(correct)
+            await state.update_data(quiz=session.to_state())
+        if session.is_finished(proverb_ids):
+            await send_quiz_result(message.chat.id, session,
+                                   'Вітаю! Ви дібрали до усіх прислів\'їв/приказок дієслова з теми: ')
             return
-        quiz_proverb = random.choice(proverbs)
-        quiz_proverb_id = quiz_proverb[0]
-        quiz_proverb_value = quiz_proverb[1]
-        correct_verb_list = db.select_one(
-            "SELECT value, aspect, number, gender, tense FROM word WHERE word.pos = 'VERB' AND word.proverb_id = ? "
-            "AND word.usage_type = 'VALUE'",
-            quiz_proverb_id)
-        correct_verb = correct_verb_list[0]
-        aspect = correct_verb_list[1]
-        number = correct_verb_list[2]
-        gender = correct_verb_list[3]
-        tense = correct_verb_list[4]
-        number_of_correct_verbs = 1
-        random_verbs = db.select_all(
-            'SELECT DISTINCT word.value FROM word JOIN proverb ON proverb_id = proverb.id '
-            "WHERE word.pos = 'VERB' AND word.proverb_id != ? AND word.aspect = ? AND word.number = ? AND word.gender "
-            "= ? AND word.tense = ?",
-            quiz_proverb_id, aspect, number, gender, tense)
-        wrong_verbs = [verb[0] for verb in random_verbs]
-        wrong_verbs = generate_groups(wrong_verbs, number_of_correct_verbs)
-        options = [correct_verb] + random.sample(wrong_verbs, 3)
-        random.shuffle(options)
-        reply_markup = generate_quiz_verb_markup(options)
-        replace_dict = {".": "\\.", "(": "\\(", ")": "\\)", "!": "\\!",
-                        "?": "\\?", "—": "\\—", "-": "\\-"}
-        proverb = quiz_proverb[1]
-        for old, new in replace_dict.items():
-            proverb = proverb.replace(old, new)
-        for verb in correct_verb_list:
-            proverb = re.sub(r'\b' + re.escape(verb) + r'\b', '──────', proverb,
-                             flags=re.IGNORECASE)
-        await bot.send_message(message.chat.id,
-                               text=f"Прислів'я/Приказка:\n *{proverb}*",
-                               reply_markup=reply_markup,
-                               parse_mode='MarkdownV2')
-        await state.update_data(correct_verbs=correct_verb,
-                                category_id=category_id,
-                                used_proverb_value=quiz_proverb_value)
-        await state.set_state(QuizVerb.answering_question)
+        await ask_verb(message.chat.id, session)
     elif message.text == 'Завершити':
         await state.clear()
         await message.answer('Вправу завершено.', reply_markup=kb.main)
@@ -618,8 +476,6 @@ async def by_lemma_in_proverb(callback: CallbackQuery, state: FSMContext):
         'Пошук здійснюватиметься за лемою у паремії.'
         '\nУведіть лему для пошуку:')
     await state.set_state(Search.lemma)
-    await state.update_data(offset=0)
-    await state.update_data(next_search=False)
 
 
 @router.callback_query(F.data == 'by_lemma_in_proverb_and_meaning')
@@ -629,8 +485,6 @@ async def by_lemma_in_proverb(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         'Пошук здійснюватиметься за лемою у паремії і значенні.\nУведіть лему для пошуку:')
     await state.set_state(Search.lemma_meaning)
-    await state.update_data(offset=0)
-    await state.update_data(next_search=False)
 
 
 @router.callback_query(F.data == 'by_first_letter_in_proverb')
@@ -639,8 +493,6 @@ async def by_lemma_in_proverb(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         'Пошук здійснюватиметься за першою літерою паремії.\nУведіть літеру для пошуку:')
     await state.set_state(Search.letter)
-    await state.update_data(offset=0)
-    await state.update_data(next_search=False)
 
 
 @router.callback_query(F.data == 'by_substring_in_proverb')
@@ -650,70 +502,128 @@ async def by_lemma_in_proverb(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         'Пошук здійснюватиметься за частинкою у паремії і значенні.\nУведіть слово чи його частину для пошуку:')
     await state.set_state(Search.substring)
-    await state.update_data(offset=0)
-    await state.update_data(next_search=False)
+
+
+async def find_ids(filter):
+    # Letter and short substring searches scan every proverb, tens of ms on a large corpus, so a cache miss runs
+    # on the search thread and other chats are served meanwhile. The result cache is only touched on the loop.
+    if not (filter.first_proverb_letter or filter.substring):
+        return corpus.find_ids(filter)
+    key = filter.get_key()
+    proverb_ids = corpus.result_cache.get(key)
+    if proverb_ids is None:
+        proverb_ids = await asyncio.get_running_loop().run_in_executor(search_executor, corpus.search_ids, filter)
+        corpus.result_cache.put(key, proverb_ids)
+    return proverb_ids
+
+
+async def start_search(message: Message, state: FSMContext, filter: ProverbsFilter):
+    # The query runs once; "Далі..." pages through the stored ids of all matches.
+    data = await state.get_data()
+    if 'search_session' in data:
+        search_sessions.pop(data['search_session'])
+    key = search_sessions.add(await find_ids(filter))
+    await state.update_data(search_session=key, cursor=0)
+    await process_results(message, state)
+
+
+LEMMA_USAGE_TYPES = {'value': ['VALUE'], 'meaning': ['VALUE', 'DESCRIPTION']}
+
+
+async def get_lemma_filter(text, usage_types):
+    lemmas = await lemmatizer.lemmatize(LemmaQuery.parse(text).get_terms())
+    return ProverbsFilter(lemma=text, usage_types=usage_types, lemmas=lemmas)
+
+
+def get_lemma_suggestions(filter):
+    # Rewrites the query with lemmas close to its first term that matches nothing.
+    query = LemmaQuery.parse(filter.lemma)
+    for group, expanded in zip(query.groups, filter.lemma_query.groups):
+        if not any(corpus.lemma_index.get_postings(lemma, filter.usage_types) for lemma in expanded):
+            return [str(query.replace(group[0], lemma))
+                    for lemma in corpus.suggest_lemmas(group[0], filter.usage_types)]
+    return []
+
+
+async def search_by_lemma(message: Message, state: FSMContext, text, usage_key):
+    filter = await get_lemma_filter(text, LEMMA_USAGE_TYPES[usage_key])
+    if not corpus.find_ids(filter):
+        # Callback data is limited to 64 bytes, so longer suggestions are not offered.
+        suggestions = [suggestion for suggestion in get_lemma_suggestions(filter)
+                       if len(f'lemma_suggestion:{usage_key}:{suggestion}'.encode('utf8')) <= 64]
+        if suggestions:
+            builder = InlineKeyboardBuilder()
+            for suggestion in suggestions:
+                builder.row(InlineKeyboardButton(text=suggestion,
+                                                 callback_data=f'lemma_suggestion:{usage_key}:{suggestion}'))
+            await message.answer('Нічого не знайдено 😔 Можливо, Ви мали на увазі:',
+                                 reply_markup=builder.as_markup())
+            return
+    await start_search(message, state, filter)
+
+
+@router.callback_query(F.data == 'by_relevance')
+async def by_relevance(callback: CallbackQuery, state: FSMContext):
+    await callback.answer('Пошук здійснюватиметься за змістом')
+    await callback.message.edit_text(
+        'Пошук здійснюватиметься за змістом паремії і тлумачення.\nУведіть кілька слів для пошуку:')
+    await state.set_state(Search.text)
 
 
 @router.message(Search.lemma)
 async def search_by_lemma_in_proverb(message: Message, state: FSMContext):
-    await state.update_data(search_type=Search.lemma)
-    if not (await state.get_data())['next_search']:
-        await state.update_data(lemma=message.text)
-    dic = await state.get_data()
-    filter = ProverbsFilter(lemma=dic['lemma'], usage_types=['VALUE'])
-    offset = (await state.get_data())['offset']
-    results = search_proverbs(filter, db, offset=offset)
-    await state.update_data(results=results)
-    await process_results(message, state)
+    await search_by_lemma(message, state, message.text, 'value')
 
 
 @router.message(Search.lemma_meaning)
 async def search_by_lemma_in_proverb_meaning(message: Message,
                                              state: FSMContext):
-    await state.update_data(search_type=Search.lemma_meaning)
-    if not (await state.get_data())['next_search']:
-        await state.update_data(lemma_meaning=message.text)
-    dic = await state.get_data()
-    filter = ProverbsFilter(lemma=dic['lemma_meaning'],
-                            usage_types=['VALUE', 'DESCRIPTION'])
-    offset = (await state.get_data())['offset']
-    results = search_proverbs(filter, db, offset=offset)
-    await state.update_data(results=results)
-    await process_results(message, state)
+    await search_by_lemma(message, state, message.text, 'meaning')
+
+
+@router.callback_query(F.data.startswith('lemma_suggestion:'))
+async def search_by_lemma_suggestion(callback: CallbackQuery, state: FSMContext):
+    _, usage_key, text = callback.data.split(':', 2)
+    await callback.message.edit_text('Пошук за лемою: ' + text)
+    await search_by_lemma(callback.message, state, text, usage_key)
+    await callback.answer()
 
 
 @router.message(Search.letter)
 async def search_by_letter_in_proverb(message: Message, state: FSMContext):
-    await state.update_data(search_type=Search.letter)
-    if not (await state.get_data())['next_search']:
-        await state.update_data(letter=message.text)
-    dic = await state.get_data()
-    filter = ProverbsFilter(first_proverb_letter=dic['letter'])
-    offset = (await state.get_data())['offset']
-    results = search_proverbs(filter, db, offset=offset)
-    await state.update_data(results=results)
-    await process_results(message, state)
+    filter = ProverbsFilter(first_proverb_letter=message.text)
+    await start_search(message, state, filter)
 
 
 @router.message(Search.substring)
 async def search_by_substring_in_proverb(message: Message, state: FSMContext):
-    await state.update_data(search_type=Search.substring)
-    if not (await state.get_data())['next_search']:
-        await state.update_data(substring=message.text)
-    dic = await state.get_data()
-    filter = ProverbsFilter(substring=dic['substring'])
-    offset = (await state.get_data())['offset']
-    results = search_proverbs(filter, db, offset=offset)
-    await state.update_data(results=results)
-    await process_results(message, state)
+    filter = ProverbsFilter(substring=message.text)
+    await start_search(message, state, filter)
+
+
+@router.message(Search.text)
+async def search_by_relevance(message: Message, state: FSMContext):
+    lemmas = await lemmatizer.lemmatize(normalize(message.text).split())
+    filter = ProverbsFilter(text=message.text, lemmas=lemmas)
+    await start_search(message, state, filter)
 
 
 @router.message(Search.send_results)
 async def process_results(message: Message, state: FSMContext):
-    results = (await state.get_data())['results']
-    offset = (await state.get_data())['offset']
+    data = await state.get_data()
+    proverb_ids = search_sessions.get(data.get('search_session'))
+    if proverb_ids is None:
+        await bot.send_message(chat_id=message.chat.id,
+                               text='Результати пошуку застаріли, повторіть пошук.\nОберіть вид пошуку:',
+                               disable_notification=True,
+                               reply_markup=kb.search)
+        await state.clear()
+        return
+    cursor = data['cursor']
+    results = corpus.get_results(proverb_ids[cursor:cursor + 5])
     if not results:
-        if offset == 0:
+        search_sessions.pop(data['search_session'])
+        if cursor == 0:
             noanswer = 'Нічого не знайдено 😔 \nПеревірте чи не допустили Ви помилки і спробуйте знову.\nОберіть вид ' \
                        'пошуку:'
             await bot.send_message(chat_id=message.chat.id, text=noanswer,
@@ -734,26 +644,24 @@ async def process_results(message: Message, state: FSMContext):
         proverbs_in_category.append(result)
     for category, proverbs_infos in by_category.items():
         await bot.send_message(chat_id=message.chat.id,
-                               text=f'Тема: *{category}*',
+                               text=f'Тема: *{escape_markdown(category)}*',
                                disable_notification=True,
                                parse_mode='MarkdownV2')
         for proverb_info in proverbs_infos:
-            replace_dict = {".": "\\.", "(": "\\(", ")": "\\)", "!": "\\!",
-                            "?": "\\?", "-": "\\-"}
-            for old, new in replace_dict.items():
-                proverb_info.proverb = proverb_info.proverb.replace(old, new)
-                proverb_info.description = proverb_info.description.replace(old,
-                                                                            new)
+            proverb_info.proverb = escape_markdown(proverb_info.proverb)
+            proverb_info.description = escape_markdown(proverb_info.description)
             if count == len(results) - 1:
-                if len(results) < 5:
+                if cursor + len(results) >= len(proverb_ids):
                     await bot.send_message(chat_id=message.chat.id,
                                            text=f'\n `{proverb_info.proverb}`  \n'
                                                 f'Значення: _{proverb_info.description}_  ',
                                            disable_notification=True,
-                                           parse_mode='MarkdownV2')
+                                           parse_mode='MarkdownV2',
+                                           reply_markup=generate_similar_markup(proverb_info.id))
                     await bot.send_message(chat_id=message.chat.id,
                                            text='Це усі знайдені прислів\'я/приказки',
                                            disable_notification=True)
+                    search_sessions.pop(data['search_session'])
                     await state.clear()
                     return
                 builder = InlineKeyboardBuilder()
@@ -764,33 +672,44 @@ async def process_results(message: Message, state: FSMContext):
                                             f'Значення: _{proverb_info.description}_  ',
                                        disable_notification=True,
                                        parse_mode='MarkdownV2',
-                                       reply_markup=builder.as_markup())
-                await state.update_data(offset=offset + 5)
+                                       reply_markup=generate_similar_markup(proverb_info.id, builder))
+                await state.update_data(cursor=cursor + 5)
                 return
             else:
                 await bot.send_message(chat_id=message.chat.id,
                                        text=f'\n `{proverb_info.proverb}`  \n'
                                             f'Значення: _{proverb_info.description}_  ',
                                        disable_notification=True,
-                                       parse_mode='MarkdownV2')
+                                       parse_mode='MarkdownV2',
+                                       reply_markup=generate_similar_markup(proverb_info.id))
                 count += 1
 
 
 @router.callback_query(F.data == 'continue_search')
 async def handle_next_search(callback: CallbackQuery, state: FSMContext):
-    search_type = (await state.get_data())['search_type']
-    await state.update_data(next_search=True)
-    if search_type == 'Search:lemma':
-        await search_by_lemma_in_proverb(callback.message, state)
-    elif search_type == 'Search:lemma_meaning':
-        await search_by_lemma_in_proverb_meaning(callback.message, state)
-    elif search_type == 'Search:letter':
-        await search_by_letter_in_proverb(callback.message, state)
-    elif search_type == 'Search:substring':
-        await search_by_substring_in_proverb(callback.message, state)
+    await process_results(callback.message, state)
     await callback.answer()  # This is necessary to stop the loading animation
 
 
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    # Inline queries come with every keystroke, so they are answered from the prefix indexes only.
+    results = []
+    for number, lemma in enumerate(corpus.complete_lemmas(inline_query.query)):
+        proverbs = corpus.get_results(corpus.lemma_index.get_postings(lemma, ['VALUE', 'DESCRIPTION'])[:5])
+        results.append(InlineQueryResultArticle(
+            id=f'lemma:{number}', title=lemma, description='Лема',
+            input_message_content=InputTextMessageContent(
+                message_text=f'Паремії з лемою "{lemma}":\n' + '\n'.join(f'• {proverb.proverb}'
+                                                                          for proverb in proverbs))))
+    for proverb in corpus.get_results(corpus.complete_proverbs(inline_query.query)):
+        results.append(InlineQueryResultArticle(
+            id=f'proverb:{len(results)}', title=proverb.proverb, description=proverb.description,
+            input_message_content=InputTextMessageContent(
+                message_text=f'{proverb.proverb}\nЗначення: {proverb.description}')))
+    await inline_query.answer(results, cache_time=300)
+
+
 async def main():
     await dp.start_polling(bot)
 
@@ -798,7 +717,13 @@ async def main():
 if __name__ == '__main__':
     dp.include_router(router)
     logging.basicConfig(level=logging.INFO)
+    # Analyzer processes fork from here; frozen objects are skipped by their GC, so the corpus pages stay shared.
+    gc.freeze()
+    lemmatizer.warm_up()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         print('Exit')
+    finally:
+        lemmatizer.close()
+        search_executor.shutdown()
@@ -0,0 +1,53 @@
+import random
+
+from corpus import Corpus
+from db import Database
+from distractors import sample_groups
+from utils import normalize
+
+# Proverbs of one topic and their verbs, all in the same form.
+PROVERBS = [
+    ('Хто рано встає, тому Бог дає.', ['встає', 'дає']),
+    ('Вовк лізе, де його не кличуть.', ['лізе', 'кличуть']),
+    ('Хто шукає, той знаходить.', ['шукає', 'знаходить']),
+    ('Що посієш, те й пожнеш.', ['посієш', 'пожнеш']),
+]
+
+
+def test_small_pool_gives_every_group():
+    # Four of five options are excluded, so random draws from all of them would mostly be rejected.
+    options = ['a', 'b', 'c', 'd', 'e']
+    rng = random.Random(1)
+    for _ in range(100):
+        assert sample_groups(options, 1, 3, {0, 1, 2, 3}, rng) == ['e']
+        assert sorted(sample_groups(options, 1, 3, {0, 1, 2}, rng)) == ['d', 'e']
+        assert len(sample_groups(options, 2, 3, {0, 1}, rng)) == 3
+
+
+def test_excluded_are_left_out():
+    options = [str(option) for option in range(1000)]
+    excluded = set(range(0, 1000, 2))
+    rng = random.Random(2)
+    for size in (1, 2):
+        for _ in range(100):
+            groups = sample_groups(options, size, 3, excluded, rng)
+            assert len(set(groups)) == 3
+            assert all(int(option) % 2 for group in groups for option in group.split(', '))
+
+
+def test_wrong_verbs_leave_out_every_verb_of_the_proverb():
+    db = Database(':memory:')
+    db.init()
+    db.execute('INSERT INTO category (id, name) VALUES (1, ?)', 'Про працю')
+    for proverb_id, (value, verbs) in enumerate(PROVERBS, 1):
+        db.execute('INSERT INTO proverb (id, value, description, category_id, value_norm, description_norm, spans) '
+                   'VALUES (?, ?, ?, 1, ?, ?, ?)', proverb_id, value, value, normalize(value), normalize(value), '')
+        for verb in verbs:
+            db.execute("INSERT INTO word (proverb_id, usage_type, value, pos, aspect, number, gender, tense, spans) "
+                       "VALUES (?, 'VALUE', ?, 'VERB', 'impf', 'sing', 'None', 'pres', '')", proverb_id, verb)
+    corpus = Corpus.load(db, seed=3)
+    for proverb_id, (_, verbs) in enumerate(PROVERBS, 1):
+        for _ in range(50):
+            wrong_verbs = corpus.get_wrong_verbs(proverb_id)
+            assert len(set(wrong_verbs)) == 3
+            assert not set(wrong_verbs) & set(verbs)
@@ -0,0 +1,47 @@
+from db import Database
+from migrations import get_migrations, get_version, migrate
+
+# Tables of a database built before the first migration.
+ORIGINAL_SCHEMA = [
+    'CREATE TABLE category (id integer primary key autoincrement, name varchar(100) unique not null)',
+    'CREATE TABLE proverb (id integer primary key autoincrement, value varchar(255) unique not null, '
+    'description varchar(500) not null, category_id integer not null, '
+    'foreign key (category_id) references category(id))',
+    'CREATE TABLE lemma (id integer primary key autoincrement, value varchar(100) unique not null, '
+    'pos varchar(25) not null)',
+    'CREATE TABLE lemmas_usage (lemma_id integer not null, proverb_id integer not null, '
+    'usage_type varchar(50) not null, foreign key (lemma_id) references lemma(id), '
+    'foreign key (proverb_id) references proverb(id))',
+    "CREATE TABLE word (id integer primary key autoincrement, proverb_id integer not null, "
+    "usage_type varchar(50) not null, value varchar(100) not null, pos varchar(25) not null, "
+    "aspect varchar(25) DEFAULT 'None', number varchar(25) DEFAULT 'None', person varchar(25) DEFAULT 'None', "
+    "gender varchar(25) DEFAULT 'None', tense varchar(25) DEFAULT 'None', "
+    "foreign key (proverb_id) references proverb(id))",
+]
+
+
+def get_schema(db):
+    tables = db.select_all("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+    indexes = db.select_all("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' "
+                            "AND name NOT LIKE 'sqlite_%' ORDER BY name")
+    return [(name, db.select_all(f'PRAGMA table_info({name})')) for (name,) in tables], indexes
+
+
+def test_fresh_database_is_at_latest_version():
+    db = Database(':memory:')
+    db.init()
+    assert get_version(db) == get_migrations()[-1][0]
+
+
+def test_migrated_database_matches_fresh_one():
+    fresh = Database(':memory:')
+    fresh.init()
+    fresh.create_indexes()
+
+    migrated = Database(':memory:')
+    for stmt in ORIGINAL_SCHEMA:
+        migrated.execute(stmt)
+    migrated.create_tables()
+    migrate(migrated)
+    assert get_version(migrated) == get_version(fresh)
+    assert get_schema(migrated) == get_schema(fresh)
@@ -0,0 +1,42 @@
+import multiprocessing
+
+import pytest
+
+pytest.importorskip('pymorphy2')
+
+from morphology import Morphology, analyze_chunk, init_worker  # noqa: E402
+
+ENTRIES = [
+    ('Без труда нема плода.', 'Щоб чогось досягти, треба працювати.'),
+    ('Хто рано встає, тому Бог дає.', 'Старанність винагороджується.'),
+    ('Сміливого й куля боїться.', 'Сміливі перемагають.'),
+]
+
+
+def test_parse_is_plain_values():
+    for token in Morphology().analyze('Хто рано встає, тому Бог дає.'):
+        assert all(value is None or type(value) is str for value in token[:8])
+
+
+def test_parallel_matches_serial():
+    serial = Morphology().analyze_entries(ENTRIES)
+    with multiprocessing.Pool(2, initializer=init_worker) as pool:
+        chunks = pool.map(analyze_chunk, [('category', ENTRIES[:2]), ('category', ENTRIES[2:])])
+    assert [record for _, records, _, _ in chunks for record in records] == serial
+
+
+def test_workers_leave_the_parse_cache_to_the_caller(tmp_path):
+    cache_file = str(tmp_path / 'parse.db')
+    writer = Morphology()
+    writer.open_disk_cache(cache_file)
+    tasks = [('category', ENTRIES[:2]), ('category', ENTRIES[2:])]
+    with multiprocessing.Pool(2, initializer=init_worker, initargs=(cache_file,)) as pool:
+        chunks = pool.map(analyze_chunk, tasks)
+    for _, _, _, parses in chunks:
+        writer.disk_rows.extend(parses)
+        writer.save()
+    assert writer.analyzer is None
+    with multiprocessing.Pool(2, initializer=init_worker, initargs=(cache_file,)) as pool:
+        cached = pool.map(analyze_chunk, tasks)
+    assert [records for _, records, _, _ in cached] == [records for _, records, _, _ in chunks]
+    assert all(counters[2] == 0 and not parses for _, _, counters, parses in cached)
@@ -0,0 +1,45 @@
+import random
+
+from quiz_session import QuizSession
+
+
+def walk(session, proverb_ids):
+    order = []
+    while not session.is_finished(proverb_ids):
+        order.append(session.get_proverb_id(proverb_ids))
+        session.record(True)
+    return order
+
+
+def test_visits_every_proverb_once():
+    rng = random.Random(1)
+    for count in range(1, 15):
+        proverb_ids = list(range(100, 100 + count))
+        for _ in range(50):
+            session = QuizSession.start(1, rng)
+            assert sorted(walk(session, proverb_ids)) == proverb_ids
+            assert session.score == count
+
+
+def test_order_is_shuffled():
+    # Stored or reversed order would ask synonyms, which share a description, one after another.
+    rng = random.Random(2)
+    proverb_ids = list(range(8))
+    orders = [walk(QuizSession.start(1, rng), proverb_ids) for _ in range(1000)]
+    in_stored_order = sum(order in (proverb_ids, proverb_ids[::-1]) for order in orders)
+    assert in_stored_order < 10
+    assert len(set(map(tuple, orders))) > 900
+
+
+def test_state_round_trip():
+    proverb_ids = list(range(12))
+    session = QuizSession.start(3, random.Random(3))
+    session.record(True)
+    session.answer = 2
+    restored = QuizSession.from_state(session.to_state())
+    assert restored.to_state() == session.to_state()
+    assert walk(restored, proverb_ids) == walk(session, proverb_ids)
+
+
+def test_empty_topic_is_finished():
+    assert QuizSession.start(1).is_finished([])
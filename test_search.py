@@ -0,0 +1,45 @@
+import pytest
+
+from corpus import Corpus
+from db import Database
+from migrations import migrate
+from search import ProverbsFilter
+from utils import normalize
+
+PROVERBS = [
+    ('Без труда нема плода.', 'Щоб чогось досягти, треба працювати.'),
+    ('Хліб — усьому голова!', 'Хліб найважливіший.'),
+    ('Де праця, там і щастя...', 'Праця приносить щастя.'),
+]
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = Database(':memory:')
+    db.init()
+    migrate(db)
+    db.execute('INSERT INTO category (id, name) VALUES (1, ?)', 'Про працю')
+    for proverb_id, (value, description) in enumerate(PROVERBS, 1):
+        db.execute('INSERT INTO proverb (id, value, description, category_id, value_norm, description_norm, spans) '
+                   'VALUES (?, ?, ?, 1, ?, ?, ?)', proverb_id, value, description, normalize(value),
+                   normalize(description), '')
+    return db
+
+
+@pytest.fixture(scope='module')
+def corpus(db):
+    return Corpus.load(db)
+
+
+@pytest.mark.parametrize('text', ['?', '—', '!', '...', ' '])
+def test_punctuation_matches_nothing(corpus, text):
+    for filter in (ProverbsFilter(first_proverb_letter=text), ProverbsFilter(substring=text)):
+        assert list(corpus.find_ids(filter)) == []
+    assert list(corpus.substring_index.find(text)) == []
+
+
+def test_letter_and_substring(corpus):
+    assert list(corpus.find_ids(ProverbsFilter(first_proverb_letter='х'))) == [2]
+    assert list(corpus.find_ids(ProverbsFilter(substring='ПРАЦ'))) == [1, 3]
+    assert [result.proverb for result in corpus.get_results(corpus.find_ids(ProverbsFilter(substring='щаст')))] == \
+        [PROVERBS[2][0]]
@@ -1,6 +1,130 @@
+import json
+import re
+from array import array
+
+import tokenize_uk
+
+READ_SIZE = 64 * 1024
+
+decoder = json.JSONDecoder()
+
+NORMALIZATION = str.maketrans({**{char: "'" for char in '’ʼ‘`´′'}, **{char: '-' for char in '‐‑‒–—―−'}})
+WORD = re.compile(r"[^\W_]+(?:['-][^\W_]+)*")
+MARKDOWN_ESCAPES = str.maketrans({char: '\\' + char for char in '\\_*[]()~`>#+-=|{}.!'})
+
 
 def read(file_name):
     with open(file_name, "r", encoding='utf8') as f:
         lines = f.readlines()
         text = '\n'.join(lines)
         return text
+
+
+def normalize(text):
+    # Lower case, one apostrophe and one hyphen character, words separated by single spaces and no other
+    # punctuation. Stored next to the corpus text at ingestion and applied to user input before lookups.
+    return ' '.join(WORD.findall(text.lower().translate(NORMALIZATION)))
+
+
+def escape_markdown(text):
+    # Escapes every character that MarkdownV2 reserves.
+    return text.translate(MARKDOWN_ESCAPES)
+
+
+def get_token_spans(text):
+    # (start, end) offsets of the word tokens of a text, punctuation left out.
+    spans = []
+    position = 0
+    for token in tokenize_uk.tokenize_words(text):
+        start = text.find(token, position)
+        if start < 0:
+            continue
+        position = start + len(token)
+        if WORD.search(token):
+            spans.append((start, position))
+    return spans
+
+
+def format_spans(spans):
+    # Spans as stored in the database: "0:4 7:12".
+    return ' '.join([f'{start}:{end}' for start, end in spans])
+
+
+def parse_spans(text):
+    # Stored spans as a flat array of start and end offsets.
+    return array('H', (int(offset) for span in (text or '').split() for offset in span.split(':')))
+
+
+class JsonStream:
+    # Walks a JSON document with a buffer of about READ_SIZE characters instead of loading all of it.
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        chunk = self.f.read(READ_SIZE)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at position {self.pos} of the buffer')
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self):
+        # Yields the keys of an object; the caller reads each value before asking for the next key.
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f'Expected \',\' or \'}}\' at position {self.pos - 1} of the buffer')
+
+
+def iter_corpus(file_name):
+    # Yields (category, proverb, description) from {category: {proverb: description}} JSON or from JSONL
+    # lines like {"category": ..., "proverb": ..., "description": ...}.
+    with open(file_name, "r", encoding='utf8') as f:
+        if file_name.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record['category'], record['proverb'], record['description']
+            return
+        stream = JsonStream(f)
+        for category in stream.iter_object():
+            for proverb in stream.iter_object():
+                yield category, proverb, stream.value()